@@ -0,0 +1,108 @@
+'''
+Breadboard connectivity: the conducting strips of the board and the nodes wires join them into.
+'''
+
+class UnionFind:
+    def __init__(self, items):
+        self.parent = {item: item for item in items}
+        self.node_ids = {item: None for item in items}
+
+    def find(self, item):
+        if self.parent[item] != item:
+            self.parent[item] = self.find(self.parent[item])
+        return self.parent[item]
+
+    def union(self, item1, item2):
+        root1 = self.find(item1)
+        root2 = self.find(item2)
+        if root1 != root2:
+            self.parent[root2] = root1
+            return True
+        return False
+
+    def set_id(self, item, node_id):
+        root = self.find(item)
+        self.node_ids[root] = node_id
+
+    def get_id(self, item):
+        root = self.find(item)
+        return self.node_ids.get(root)
+
+# Conducting strips of the board: 2 top rails, 40 top columns, 40 bottom columns, 2 bottom rails
+NUM_STRIPS = 84
+
+def strip_of(row, col):
+    # Strip of a hole, which is also its node id while no wire is attached
+    if row in (0, 1):
+        return row
+    if row in (13, 14):
+        return 82 + row - 13
+    if row <= 6:
+        return 2 + col
+    return 42 + col
+
+class BoardConnectivity:
+    '''
+    Electrical nodes of the board kept up to date wire by wire. The strips are fixed, so only
+    wires merge them: adding a wire is a union, removing one re-links just the group it was in
+    from its remaining wires. A group's node id is its smallest strip, so rail 0 stays ground.
+    Both return the strips whose node id changed.
+    '''
+    def __init__(self, num_strips=NUM_STRIPS):
+        self.uf = UnionFind(range(num_strips))
+        self.members = {strip: [strip] for strip in range(num_strips)}
+        self.wires = {strip: {} for strip in range(num_strips)}
+        for strip in range(num_strips):
+            self.uf.set_id(strip, strip)
+
+    def node_id(self, strip):
+        return self.uf.get_id(strip)
+
+    def add_wire(self, a, b):
+        self.wires[a][b] = self.wires[a].get(b, 0) + 1
+        self.wires[b][a] = self.wires[b].get(a, 0) + 1
+        root_a = self.uf.find(a)
+        root_b = self.uf.find(b)
+        if root_a == root_b:
+            return []
+        # Hang the smaller group under the larger one
+        if len(self.members[root_a]) < len(self.members[root_b]):
+            root_a, root_b = root_b, root_a
+        id_a = self.uf.node_ids[root_a]
+        id_b = self.uf.node_ids[root_b]
+        changed = list(self.members[root_b] if id_a < id_b else self.members[root_a])
+        self.uf.union(root_a, root_b)
+        self.members[root_a].extend(self.members.pop(root_b))
+        self.uf.set_id(root_a, min(id_a, id_b))
+        return changed
+
+    def remove_wire(self, a, b):
+        for x, y in ((a, b), (b, a)):
+            self.wires[x][y] -= 1
+            if not self.wires[x][y]:
+                del self.wires[x][y]
+        if b in self.wires[a]:
+            # A parallel wire still joins them
+            return []
+
+        root = self.uf.find(a)
+        old_id = self.uf.node_ids[root]
+        group = self.members.pop(root)
+        unvisited = set(group)
+        changed = []
+        while unvisited:
+            start = min(unvisited)
+            unvisited.discard(start)
+            part = [start]
+            for strip in part:
+                for other in self.wires[strip]:
+                    if other in unvisited:
+                        unvisited.discard(other)
+                        part.append(other)
+            for strip in part:
+                self.uf.parent[strip] = start
+            self.members[start] = part
+            self.uf.set_id(start, min(part))
+            if start != old_id:
+                changed.extend(part)
+        return changed
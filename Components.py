@@ -1,32 +1,185 @@
 '''
 Included components: Wire, Battery, Resistor, LED, Capacitor, Inductor
 '''
-class Wire:
-    def __init__(self, node1, node2, name="Wire"):
-        self.node1 = node1
-        self.node2 = node2
-        self.name = name
-        self.connected_components = []
-class Battery:
-    def __init__(self, node1, node2, node_id_1, node_id_2, voltage, name="Battery"):
+import copy
+import numpy as np
+
+class ComponentTable:
+    '''
+    Struct-of-arrays storage behind the component classes: one row per component holding its
+    type code, node ids, value and simulation state, so the solver can read and write whole columns.
+    Components are thin views (table, row) onto it; freed rows are recycled.
+    '''
+    COLUMNS = {
+        "kind": np.int8,
+        "node_id_1": np.int64,
+        "node_id_2": np.int64,
+        "value": float,
+        "current": float,
+        "voltage_drop": float,
+        "prev_voltage_drop": float,
+        "prev_current": float,
+        "prev_voltage_drop_signed": float,
+        "brightness": float,
+        "junction_voltage": float,
+    }
+    # Stored in the node id columns for components that are not placed yet
+    NO_NODE = -1
+
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.free = []
+        for column, dtype in self.COLUMNS.items():
+            setattr(self, column, np.zeros(capacity, dtype=dtype))
+
+    def __len__(self):
+        return self.size - len(self.free)
+
+    def allocate(self, kind):
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.size == len(self.kind):
+                self.grow(max(16, 2 * self.size))
+            row = self.size
+            self.size += 1
+        for column in self.COLUMNS:
+            getattr(self, column)[row] = 0
+        self.kind[row] = kind
+        self.node_id_1[row] = self.node_id_2[row] = self.NO_NODE
+        return row
+
+    def release(self, row):
+        self.free.append(row)
+
+    def grow(self, capacity):
+        for column in self.COLUMNS:
+            old = getattr(self, column)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, column, new)
+
+    @classmethod
+    def gather(cls, components):
+        # The table holding these components and their rows in it. Components spread over several
+        # tables (e.g. some restored by undo, some newly placed) are first moved into the largest one
+        tables = {}
+        for component in components:
+            tables.setdefault(id(component.table), [component.table, 0])[1] += 1
+        if not tables:
+            return DEFAULT_TABLE, np.zeros(0, dtype=np.int64)
+        table = max(tables.values(), key=lambda entry: entry[1])[0]
+        for component in components:
+            if component.table is not table:
+                component.move_to(table)
+        return table, np.array([component.row for component in components], dtype=np.int64)
+
+# Table used by components constructed without one
+DEFAULT_TABLE = ComponentTable()
+
+def column(name):
+    # Attribute backed by a float column of the component's row
+    def get(self):
+        return float(getattr(self.table, name)[self.row])
+    def set(self, value):
+        getattr(self.table, name)[self.row] = value
+    return property(get, set)
+
+def node_column(name):
+    # Node id attribute; None while the component is not placed
+    def get(self):
+        node = int(getattr(self.table, name)[self.row])
+        return None if node == ComponentTable.NO_NODE else node
+    def set(self, node):
+        getattr(self.table, name)[self.row] = ComponentTable.NO_NODE if node is None else node
+    return property(get, set)
+
+class Component:
+    '''
+    Base of the table-backed components: board positions and name live on the object,
+    everything the solver touches lives in the table row.
+    '''
+    __slots__ = ("table", "row", "node1", "node2", "name")
+    KIND = -1
+
+    def __init__(self, node1, node2, node_id_1, node_id_2, name, table=None):
+        self.table = DEFAULT_TABLE if table is None else table
+        self.row = self.table.allocate(self.KIND)
         self.node1 = node1
         self.node2 = node2
         self.node_id_1 = node_id_1
         self.node_id_2 = node_id_2
-        self.voltage = voltage
         self.name = name
-        self.current = 0.0
-class Resistor:
-    def __init__(self, node1, node2, node_id_1, node_id_2, resistance, voltage_drop, name="Resistor"):
+
+    node_id_1 = node_column("node_id_1")
+    node_id_2 = node_column("node_id_2")
+    current = column("current")
+
+    def move_to(self, table):
+        # Copy this row into another table and view it there
+        row = table.allocate(self.KIND)
+        for name in ComponentTable.COLUMNS:
+            getattr(table, name)[row] = getattr(self.table, name)[self.row]
+        self.table.release(self.row)
+        self.table = table
+        self.row = row
+
+    def __deepcopy__(self, memo):
+        # Copy only this component's row; everything copied in one deepcopy shares one new table
+        table = memo.get(id(self.table))
+        if table is None:
+            table = memo[id(self.table)] = ComponentTable(capacity=16)
+        clone = object.__new__(type(self))
+        memo[id(self)] = clone
+        for name in self.all_slots():
+            if name not in ("table", "row") and hasattr(self, name):
+                setattr(clone, name, copy.deepcopy(getattr(self, name), memo))
+        clone.table = table
+        clone.row = table.allocate(self.KIND)
+        for name in ComponentTable.COLUMNS:
+            getattr(table, name)[clone.row] = getattr(self.table, name)[self.row]
+        return clone
+
+    @classmethod
+    def all_slots(cls):
+        return [name for klass in cls.__mro__ for name in getattr(klass, "__slots__", ())]
+
+    def __del__(self):
+        table = getattr(self, "table", None)
+        if table is not None:
+            table.release(self.row)
+
+class Wire:
+    __slots__ = ("node1", "node2", "node_id_1", "node_id_2", "name", "connected_components")
+
+    def __init__(self, node1, node2, name="Wire"):
         self.node1 = node1
         self.node2 = node2
-        self.node_id_1 = node_id_1
-        self.node_id_2 = node_id_2
+        self.name = name
+        self.connected_components = []
+
+class Battery(Component):
+    __slots__ = ()
+    KIND = 0
+
+    def __init__(self, node1, node2, node_id_1, node_id_2, voltage, name="Battery", table=None):
+        Component.__init__(self, node1, node2, node_id_1, node_id_2, name, table)
+        self.voltage = voltage
+
+    voltage = column("value")
+
+class Resistor(Component):
+    __slots__ = ()
+    KIND = 1
+
+    def __init__(self, node1, node2, node_id_1, node_id_2, resistance, voltage_drop, name="Resistor", table=None):
+        Component.__init__(self, node1, node2, node_id_1, node_id_2, name, table)
         self.resistance = resistance
         self.voltage_drop = voltage_drop
-        self.name = name
-        self.current = 0.0
-    
+
+    resistance = column("value")
+    voltage_drop = column("voltage_drop")
+
     def get_color_bands(self, resistance):    
         colors = ["black", "brown", "red", "orange", "yellow", "green", "blue", "violet", "gray", "white"]
         if resistance <= 0:
@@ -55,39 +208,43 @@ class Resistor:
         
         return [colors[d1], colors[d2], colors[zeros], "gold"]
 
-class Capacitor:
-    def __init__(self, node1, node2, node_id_1, node_id_2, capacitance, voltage_drop, name="Capacitor"):
-        self.node1 = node1
-        self.node2 = node2
-        self.node_id_1 = node_id_1
-        self.node_id_2 = node_id_2
+class Capacitor(Component):
+    __slots__ = ()
+    KIND = 2
+
+    def __init__(self, node1, node2, node_id_1, node_id_2, capacitance, voltage_drop, name="Capacitor", table=None):
+        Component.__init__(self, node1, node2, node_id_1, node_id_2, name, table)
         self.capacitance = capacitance
         self.voltage_drop = voltage_drop
-        self.name = name
-        self.current = 0.0
-        self._prev_voltage_drop = 0.0
 
-class Inductor:
-    def __init__(self, node1, node2, node_id_1, node_id_2, inductance, voltage_drop, name="Inductor"):
-        self.node1 = node1
-        self.node2 = node2
-        self.node_id_1 = node_id_1
-        self.node_id_2 = node_id_2
+    capacitance = column("value")
+    voltage_drop = column("voltage_drop")
+    _prev_voltage_drop = column("prev_voltage_drop")
+
+class Inductor(Component):
+    __slots__ = ()
+    KIND = 3
+
+    def __init__(self, node1, node2, node_id_1, node_id_2, inductance, voltage_drop, name="Inductor", table=None):
+        Component.__init__(self, node1, node2, node_id_1, node_id_2, name, table)
         self.inductance = inductance
         self.voltage_drop = voltage_drop
-        self.name = name
-        self.current = 0.0
-        self._prev_current = 0.0
 
-class LED:
-    def __init__(self, node1, node2, node_id_1, node_id_2, resistance, voltage_drop, color, name="LED"):
-        self.node1 = node1
-        self.node2 = node2
-        self.node_id_1 = node_id_1
-        self.node_id_2 = node_id_2
+    inductance = column("value")
+    voltage_drop = column("voltage_drop")
+    _prev_current = column("prev_current")
+    _prev_voltage_drop_signed = column("prev_voltage_drop_signed")
+
+class LED(Component):
+    __slots__ = ("color",)
+    KIND = 4
+
+    def __init__(self, node1, node2, node_id_1, node_id_2, resistance, voltage_drop, color, name="LED", table=None):
+        Component.__init__(self, node1, node2, node_id_1, node_id_2, name, table)
         self.resistance = resistance
         self.voltage_drop = voltage_drop
         self.color = color
-        self.name = name
-        self.current = 0
-        self.brightness = 0.0
\ No newline at end of file
+
+    resistance = column("value")
+    voltage_drop = column("voltage_drop")
+    brightness = column("brightness")
@@ -1,175 +1,953 @@
+import bisect
+import copy
+from collections import OrderedDict
 import numpy as np
-from Components import Wire, Battery, Resistor, Capacitor, Inductor, LED
+from Components import ComponentTable, Wire, Battery, Resistor, Capacitor, Inductor, LED
 
-def ModifiedNodalAnalysis(incidence_matrix, components, active_nodes, dt=1/60.0):
-    # Normalize non-directional components before analysis
-    normalize_bidirectional_components(components)
-    loads = [component for component in components if component.name != "Battery"]
-    sources = [component for component in components if component.name == "Battery"]
-    load_matrix = [row for i, row in enumerate(incidence_matrix) if components[i].name != "Battery"]
-    source_matrix = [row for i, row in enumerate(incidence_matrix) if components[i].name == "Battery"]
-    load_matrix = np.atleast_2d(load_matrix)
-    source_matrix = np.atleast_2d(source_matrix)
-
-    # Conductance Matrix
-    G = np.zeros((len(loads), len(loads)))
-    for i in range(len(loads)):
-        for j in range(len(loads)):
-            if i == j:
-                if loads[i].name == "Capacitor":
-                    G[i][j] = 2 * loads[i].capacitance / dt
-                elif loads[i].name == "Inductor":
-                    if loads[i].inductance > 0:
-                        G[i][j] = dt / (2 * loads[i].inductance)
-                    else:
-                        G[i][j] = 1e9
-                else:
-                    if loads[i].resistance > 0:
-                        G[i][j] = 1 / loads[i].resistance
-                    else:
-                        G[i][j] = 1e9  # Very high conductance for 0 resistance to avoid singular matrices
-    
-    # Infintely small conductance to avoid singular matrices
-    GMIN = 1e-12
-    # Z Vector
-    Z = np.zeros(len(active_nodes) + len(sources))
-        
-    if len(sources) == 0:
-        # Battery-less circuit Support (RC Discharge)
-        Master = load_matrix.T @ G @ load_matrix
-        for i in range(len(active_nodes)):
-            Master[i][i] += GMIN
-            
-        # Add historical current from capacitors and inductors
-        for i, component in enumerate(components):
-            if component.name == "Capacitor":
-                Ieq = (2 * component.capacitance / dt) * component._prev_voltage_drop + getattr(component, 'current', 0.0)
-                if component.node_id_1 in active_nodes:
-                    idx1 = active_nodes.index(component.node_id_1)
-                    Z[idx1] += Ieq
-                if component.node_id_2 in active_nodes:
-                    idx2 = active_nodes.index(component.node_id_2)
-                    Z[idx2] -= Ieq
-            elif component.name == "Inductor":
-                prev_v = getattr(component, '_prev_voltage_drop_signed', 0.0)
-                Ieq = component._prev_current + (dt / (2 * component.inductance)) * prev_v
-                if component.node_id_1 in active_nodes:
-                    idx1 = active_nodes.index(component.node_id_1)
-                    Z[idx1] -= Ieq
-                if component.node_id_2 in active_nodes:
-                    idx2 = active_nodes.index(component.node_id_2)
-                    Z[idx2] += Ieq
-        
-        gnd_idx = active_nodes.index(0) if 0 in active_nodes else 0
-        
-        M_reduced = np.delete(Master, gnd_idx, axis=0)
-        M_reduced = np.delete(M_reduced, gnd_idx, axis=1)
-        Z_reduced = np.delete(Z[:len(active_nodes)], gnd_idx)
-        
+# scipy is optional: the pygbag/WebAssembly build only ships NumPy
+try:
+    import scipy.sparse as sparse
+    import scipy.sparse.linalg as sparse_linalg
+except ImportError:
+    sparse = None
+    sparse_linalg = None
+
+# Infintely small conductance to avoid singular matrices
+GMIN = 1e-12
+# Very high conductance used for 0 resistance / 0 inductance to avoid singular matrices
+GMAX = 1e9
+
+# Above this many nodes the "auto" backend switches to sparse assembly and factorization
+SPARSE_NODE_THRESHOLD = 300
+
+# Branch type codes used by the stamping engine
+RESISTIVE = 0
+CAPACITIVE = 1
+INDUCTIVE = 2
+SOURCE = 3
+
+# Branch type of every ComponentTable type code (Battery, Resistor, Capacitor, Inductor, LED)
+KIND_BRANCHES = np.zeros(max(c.KIND for c in (Battery, Resistor, Capacitor, Inductor, LED)) + 1, dtype=np.int8)
+KIND_BRANCHES[Battery.KIND] = SOURCE
+KIND_BRANCHES[Resistor.KIND] = RESISTIVE
+KIND_BRANCHES[Capacitor.KIND] = CAPACITIVE
+KIND_BRANCHES[Inductor.KIND] = INDUCTIVE
+KIND_BRANCHES[LED.KIND] = RESISTIVE
+
+def branch_kinds(components):
+    table, rows = ComponentTable.gather(components)
+    return KIND_BRANCHES[table.kind[rows]]
+
+# Attribute holding the value of each component type
+VALUE_ATTRIBUTES = {"Battery": "voltage", "Resistor": "resistance", "LED": "resistance", "Capacitor": "capacitance", "Inductor": "inductance"}
+
+def component_values(components):
+    # Every value attribute is backed by the table's value column
+    table, rows = ComponentTable.gather(components)
+    return table.value[rows].copy()
+
+def branch_conductances(kinds, values, dt):
+    # Companion-model conductance of every branch; values may carry leading batch dimensions
+    values = np.asarray(values, dtype=float)
+    positive = values > 0
+    safe = np.where(positive, values, 1.0)
+    g = np.where(positive, 1 / safe, GMAX)
+    g = np.where(kinds == CAPACITIVE, 2 * values / dt, g)
+    g = np.where(kinds == INDUCTIVE, np.where(positive, dt / (2 * safe), GMAX), g)
+    return g
+
+def incidence_node_indices(incidence_matrix):
+    # Column of the -1 (node_id_1) and +1 (node_id_2) entry of every incidence row, -1 when absent
+    A = np.atleast_2d(incidence_matrix)
+    neg = A == -1
+    pos = A == 1
+    idx1 = np.where(neg.any(axis=1), neg.argmax(axis=1), -1)
+    idx2 = np.where(pos.any(axis=1), pos.argmax(axis=1), -1)
+    return idx1, idx2
+
+def node_indices(components, active_nodes):
+    # Same indices as incidence_node_indices(generate_incidence_matrix(...)) without building the matrix
+    position = {node: j for j, node in enumerate(active_nodes)}
+    idx1 = np.full(len(components), -1, dtype=np.int64)
+    idx2 = np.full(len(components), -1, dtype=np.int64)
+    for i, component in enumerate(components):
+        if component.node_id_1 == component.node_id_2:
+            continue
+        idx1[i] = position.get(component.node_id_1, -1)
+        idx2[i] = position.get(component.node_id_2, -1)
+    return idx1, idx2
+
+class StampPlan:
+    '''
+    Per-component node index arrays for a fixed topology, precomputed once so the MNA
+    system and its right hand side can be assembled with scatter-adds instead of Python loops.
+    '''
+    def __init__(self, kinds, idx1, idx2, num_nodes):
+        self.num_nodes = num_nodes
+        self.kinds = kinds
+        self.idx1 = idx1
+        self.idx2 = idx2
+
+        self.loads = np.flatnonzero(self.kinds != SOURCE)
+        self.sources = np.flatnonzero(self.kinds == SOURCE)
+        self.capacitors = np.flatnonzero(self.kinds == CAPACITIVE)
+        self.inductors = np.flatnonzero(self.kinds == INDUCTIVE)
+        self.resistors = np.flatnonzero(self.kinds == RESISTIVE)
+        self.size = num_nodes + len(self.sources)
+
+        # Conductance stamp pattern: (i1,i1) +g, (i2,i2) +g, (i1,i2) -g, (i2,i1) -g
+        l1 = idx1[self.loads]
+        l2 = idx2[self.loads]
+        rows = np.concatenate([l1, l2, l1, l2])
+        cols = np.concatenate([l1, l2, l2, l1])
+        sign = np.concatenate([np.ones(2 * len(l1)), -np.ones(2 * len(l1))])
+        self.g_valid = (rows >= 0) & (cols >= 0)
+        self.g_rows = rows[self.g_valid]
+        self.g_cols = cols[self.g_valid]
+        self.g_sign = sign[self.g_valid]
+
+        # Voltage source stamp pattern: incidence entries in the source rows/columns, plus GMIN on every node
+        s1 = idx1[self.sources]
+        s2 = idx2[self.sources]
+        k = num_nodes + np.arange(len(self.sources))
+        s_nodes = np.concatenate([s1, s2])
+        s_rows = np.concatenate([k, k])
+        s_vals = np.concatenate([-np.ones(len(s1)), np.ones(len(s2))])
+        s_valid = s_nodes >= 0
+        s_nodes, s_rows, s_vals = s_nodes[s_valid], s_rows[s_valid], s_vals[s_valid]
+        diag = np.arange(num_nodes)
+        self.c_rows = np.concatenate([s_nodes, s_rows, diag])
+        self.c_cols = np.concatenate([s_rows, s_nodes, diag])
+        self.c_vals = np.concatenate([s_vals, s_vals, np.full(num_nodes, GMIN)])
+
+    def load_conductances(self, table, rows, dt):
+        return branch_conductances(self.kinds[self.loads], table.value[rows[self.loads]], dt)
+
+    def triplets(self, g, sources=True):
+        # (row, col, value) of every conductance, source and GMIN stamp; duplicates are summed on assembly.
+        # sources=False leaves out the source and GMIN stamps (just the load pattern weighted by g)
+        values = np.tile(g, 4)[self.g_valid] * self.g_sign
+        if not sources:
+            return self.g_rows, self.g_cols, values
+        rows = np.concatenate([self.g_rows, self.c_rows])
+        cols = np.concatenate([self.g_cols, self.c_cols])
+        values = np.concatenate([values, self.c_vals])
+        return rows, cols, values
+
+    def assemble(self, g, sources=True):
+        # Scatter every stamp into the dense block matrix in one pass
+        rows, cols, values = self.triplets(g, sources)
+        return np.bincount(rows * self.size + cols, weights=values, minlength=self.size * self.size).reshape(self.size, self.size)
+
+    def assemble_sparse(self, g, sources=True):
+        rows, cols, values = self.triplets(g, sources)
+        return sparse.csr_matrix((values, (rows, cols)), shape=(self.size, self.size))
+
+    def rhs(self, table, rows, dt):
+        Z = np.zeros(self.size)
+        caps = rows[self.capacitors]
+        inds = rows[self.inductors]
+        cap_ieq = (2 * table.value[caps] / dt) * table.prev_voltage_drop[caps] + table.current[caps]
+        ind_ieq = table.prev_current[inds] + branch_conductances(INDUCTIVE, table.value[inds], dt) * table.prev_voltage_drop_signed[inds]
+
+        # Capacitor history current enters node_id_1, inductor history current leaves it
+        nodes = np.concatenate([self.idx1[self.capacitors], self.idx2[self.capacitors], self.idx1[self.inductors], self.idx2[self.inductors]])
+        currents = np.concatenate([cap_ieq, -cap_ieq, -ind_ieq, ind_ieq])
+        valid = nodes >= 0
+        Z[:self.num_nodes] = np.bincount(nodes[valid], weights=currents[valid], minlength=self.num_nodes)
+
+        Z[self.num_nodes:] = table.value[rows[self.sources]]
+        return Z
+
+class Factorization:
+    '''
+    Reusable factorization of a ground-reduced MNA matrix. NumPy has no LU solve of its own
+    (and scipy is not available in the pygbag build), so the factored form is the cached
+    inverse: every solve after the first is a single matrix-vector product.
+    '''
+    def __init__(self, matrix):
+        self.matrix = matrix
         try:
-            voltages_reduced = np.linalg.solve(M_reduced, Z_reduced)
-            if np.isnan(voltages_reduced).any():
-                voltages_reduced = np.zeros(len(active_nodes) - 1)
+            self.inverse = np.linalg.inv(matrix)
+            if not np.isfinite(self.inverse).all():
+                self.inverse = None
         except np.linalg.LinAlgError:
-            voltages_reduced = np.zeros(len(active_nodes) - 1)
-            
-        full_voltages = np.insert(voltages_reduced, gnd_idx, 0.0)
-        battery_currents = []
-        
-    else:
-        # Standard block matrix with Battery sources
-        Master = np.block([
-            [load_matrix.T@G@load_matrix, source_matrix.T],
-            [source_matrix, np.atleast_2d(np.zeros((len(source_matrix), len(source_matrix))))]
-        ])
-        
-        for i in range(len(active_nodes)):
-            Master[i][i] += GMIN
-
-        # Add historical current from capacitors and inductors
-        for i, component in enumerate(components):
-            if component.name == "Capacitor":
-                Ieq = (2 * component.capacitance / dt) * component._prev_voltage_drop + getattr(component, 'current', 0.0)
-                if component.node_id_1 in active_nodes:
-                    idx1 = active_nodes.index(component.node_id_1)
-                    Z[idx1] += Ieq
-                if component.node_id_2 in active_nodes:
-                    idx2 = active_nodes.index(component.node_id_2)
-                    Z[idx2] -= Ieq
-            elif component.name == "Inductor":
-                prev_v = getattr(component, '_prev_voltage_drop_signed', 0.0)
-                Ieq = component._prev_current + (dt / (2 * component.inductance)) * prev_v
-                if component.node_id_1 in active_nodes:
-                    idx1 = active_nodes.index(component.node_id_1)
-                    Z[idx1] -= Ieq
-                if component.node_id_2 in active_nodes:
-                    idx2 = active_nodes.index(component.node_id_2)
-                    Z[idx2] += Ieq
-
-        for i, source in enumerate(sources):
-            Z[i + len(active_nodes)] = source.voltage
-            
-        if 0 in active_nodes:
-            gnd_idx = active_nodes.index(0)
-        else:
-            gnd_idx = 0
+            self.inverse = None
 
-        # Remove Ground Row and Column
-        M_reduced = np.delete(Master, gnd_idx, axis=0)
-        M_reduced = np.delete(M_reduced, gnd_idx, axis=1)
-        Z_reduced = np.delete(Z, gnd_idx)
+    def solve(self, rhs):
+        # rhs may also be a matrix of right hand sides, one per column
+        if self.inverse is None:
+            return np.zeros(np.shape(rhs))
+        x = self.inverse @ rhs
+        if np.isnan(x).any():
+            return np.zeros(np.shape(rhs))
+        return x
 
-        # Solve for Voltages
+class SparseFactorization:
+    '''
+    Sparse LU (SuperLU) factorization of a ground-reduced CSR MNA matrix for large netlists.
+    '''
+    def __init__(self, matrix):
+        self.matrix = matrix
         try:
-            x = np.linalg.solve(M_reduced, Z_reduced)
-            if np.isnan(x).any():
-                x = np.zeros(len(M_reduced))
-        except np.linalg.LinAlgError:
-            x = np.zeros(len(M_reduced))
-            
-        voltages_reduced = x[:len(active_nodes)-1]
-        full_voltages = np.insert(voltages_reduced, gnd_idx, 0.0)
-        battery_currents = x[len(active_nodes)-1:]
-    
-    # Calculate voltage drops and currents
-    voltage_dict = {}
-    for i, voltage in enumerate(full_voltages):
-        voltage_dict[active_nodes[i]] = voltage
-
-    for i, source in enumerate(sources):
-        source.current = float(battery_currents[i])
+            self.lu = sparse_linalg.splu(matrix.tocsc())
+        except RuntimeError:
+            # Exactly singular
+            self.lu = None
 
-    for component in components:
-        if isinstance(component, (Resistor, LED, Capacitor, Inductor)):
-            v1 = voltage_dict.get(component.node_id_1, 0)
-            v2 = voltage_dict.get(component.node_id_2, 0)
-            
-            # Voltage drop from node1 to node2
-            v_drop = v1 - v2
-            
-            if isinstance(component, Capacitor):
-                V_old = component._prev_voltage_drop
-                G_eq = 2 * component.capacitance / dt
-                component.current = G_eq * (v_drop - V_old) - getattr(component, 'current', 0.0)
-                component.voltage_drop = v_drop
-                component._prev_voltage_drop = v_drop
-            elif isinstance(component, Inductor):
-                G_eq = dt / (2 * component.inductance) if component.inductance > 0 else 1e9
-                component.current = G_eq * v_drop + component._prev_current + G_eq * getattr(component, '_prev_voltage_drop_signed', 0.0)
-                component.voltage_drop = v_drop
-                component._prev_voltage_drop_signed = v_drop
-                component._prev_current = component.current
+    def solve(self, rhs):
+        if self.lu is None:
+            return np.zeros(np.shape(rhs))
+        x = self.lu.solve(rhs)
+        if not np.isfinite(x).all():
+            return np.zeros(np.shape(rhs))
+        return x
+
+class DiodeNewton:
+    '''
+    Newton-Raphson solve of the LEDs (Shockley diode plus series resistance) of a CompiledCircuit,
+    each iteration applied to the factored linear system as a rank-m Woodbury correction.
+    '''
+    MAX_ITERATIONS = 100
+    # Convergence tolerances on the junction voltages
+    ABSTOL = 1e-9
+    RELTOL = 1e-6
+    MAX_CACHED_UPDATES = 8
+
+    def __init__(self, compiled):
+        self.compiled = compiled
+        positions = np.flatnonzero(compiled.table.kind[compiled.rows] == LED.KIND)
+        self.rows = compiled.rows[positions]
+        self.idx1 = compiled.plan.idx1[positions]
+        self.idx2 = compiled.plan.idx2[positions]
+        self.saturation, self.nvt = led_parameters([compiled.components[i].color for i in positions])
+        self.v_crit = self.nvt * np.log(self.nvt / (np.sqrt(2) * self.saturation))
+        self.currents = np.zeros(len(self.rows))
+        self._updates = {}
+
+        # Instrumentation: iterations of the last solve, totals over all solves, solves that hit MAX_ITERATIONS
+        self.iterations = 0
+        self.total_iterations = 0
+        self.solves = 0
+        self.failures = 0
+
+    def __getstate__(self):
+        # The cached updates hold factorizations, which are dropped like CompiledCircuit's own
+        state = self.__dict__.copy()
+        state['_updates'] = {}
+        return state
+
+    def incidence(self, size):
+        # Ground-reduced LED incidence (size x m): +1 at node_id_1 and -1 at node_id_2, so B.T @ x are the LED voltages
+        B = np.zeros((size, len(self.rows)))
+        gnd = self.compiled.gnd_idx
+        for sign, idx in ((1.0, self.idx1), (-1.0, self.idx2)):
+            valid = np.flatnonzero((idx >= 0) & (idx != gnd))
+            B[idx[valid] - (idx[valid] > gnd), valid] += sign
+        return B
+
+    def update(self, factor):
+        # B, W = A^-1 B and S = B.T W for a factored linear system A, computed once per factorization
+        entry = self._updates.get(id(factor))
+        if entry is None or entry[0] is not factor:
+            B = self.incidence(factor.matrix.shape[0])
+            W = factor.solve(B)
+            entry = (factor, B, W, B.T @ W)
+            if len(self._updates) >= self.MAX_CACHED_UPDATES:
+                self._updates.pop(next(iter(self._updates)))
+            self._updates[id(factor)] = entry
+        return entry[1:]
+
+    def linearize(self, vd, resistance):
+        # Branch current, its voltage and small-signal conductance at junction voltage vd
+        e = np.exp(vd / self.nvt)
+        i = self.saturation * (e - 1)
+        g_d = self.saturation * e / self.nvt + GMIN
+        return i, vd + resistance * i, g_d / (1 + resistance * g_d), g_d
+
+    def conductance(self):
+        # Small-signal conductance of every LED at its present junction voltage
+        resistance = np.maximum(self.compiled.table.value[self.rows], 0.0)
+        return self.linearize(self.compiled.table.junction_voltage[self.rows], resistance)[2]
+
+    def solve(self, factor, x):
+        # Newton iterations from x, the solution of factor's linear system; LED currents are left in self.currents
+        t = self.compiled.table
+        B, W, S = self.update(factor)
+        resistance = np.maximum(t.value[self.rows], 0.0)
+        g_linear = branch_conductances(RESISTIVE, t.value[self.rows], 1.0)
+        vd = t.junction_voltage[self.rows]
+        identity = np.eye(len(vd))
+
+        converged = False
+        for iteration in range(1, self.MAX_ITERATIONS + 1):
+            i, v_lin, g, g_d = self.linearize(vd, resistance)
+            # The LED current i + g (v - v_lin) replaces g_linear v: a current source from node_id_1 to
+            # node_id_2 and a change of delta in the conductance stamp
+            i_eq = i - g * v_lin
+            delta = g - g_linear
+            x_lin = x - W @ i_eq
+            try:
+                y = np.linalg.solve(identity + S * delta, B.T @ x_lin)
+            except np.linalg.LinAlgError:
+                y = np.linalg.lstsq(identity + S * delta, B.T @ x_lin, rcond=None)[0]
+            x_new = x_lin - W @ (delta * y)
+            v = B.T @ x_new
+            self.currents = i_eq + g * v
+
+            vd_new = vd + (g / g_d) * (v - v_lin)
+            limited = limit_junction_voltage(vd_new, vd, self.nvt, self.v_crit)
+            converged = np.array_equal(limited, vd_new) and np.all(np.abs(vd_new - vd) <= self.ABSTOL + self.RELTOL * np.abs(vd_new))
+            vd = limited
+            if converged:
+                break
+
+        t.junction_voltage[self.rows] = vd
+        self.iterations = iteration
+        self.total_iterations += iteration
+        self.solves += 1
+        if not converged:
+            self.failures += 1
+        return x_new
+
+def select_backend(backend, num_nodes):
+    # "dense", "sparse" or "auto"; sparse silently falls back to dense when scipy is missing
+    if sparse is None:
+        return "dense"
+    if backend == "auto":
+        return "sparse" if num_nodes > SPARSE_NODE_THRESHOLD else "dense"
+    return backend
+
+class CompiledCircuit:
+    '''
+    A component list compiled once per edit. Holds the node indexing, incidence matrix,
+    source/load partitions and the factored, ground-reduced MNA matrix for each dt so that a
+    timestep only has to rebuild the history current vector and back-substitute.
+    '''
+    MAX_CACHED_FACTORIZATIONS = 4
+
+    def __init__(self, components, active_nodes=None, incidence_matrix=None, backend="auto"):
+        self.components = list(components)
+        normalize_bidirectional_components(self.components)
+        if active_nodes is None:
+            active_nodes = list(set([c.node_id_1 for c in self.components] + [c.node_id_2 for c in self.components]))
+        self.active_nodes = list(active_nodes)
+        self.num_nodes = len(self.active_nodes)
+        self.backend = select_backend(backend, self.num_nodes)
+
+        self._incidence_matrix = incidence_matrix
+        if incidence_matrix is not None and len(self.components):
+            idx1, idx2 = incidence_node_indices(incidence_matrix)
+        else:
+            idx1, idx2 = node_indices(self.components, self.active_nodes)
+        # Values and state are read from and written to the component table as whole columns
+        self.table, self.rows = ComponentTable.gather(self.components)
+        self.plan = StampPlan(branch_kinds(self.components), idx1, idx2, self.num_nodes)
+        self._dc_plan = None
+        self.cap_rows = self.rows[self.plan.capacitors]
+        self.ind_rows = self.rows[self.plan.inductors]
+        self.res_rows = self.rows[self.plan.resistors]
+        self.load_rows = self.rows[self.plan.loads]
+        self.source_rows = self.rows[self.plan.sources]
+        self.led_rows = self.rows[self.table.kind[self.rows] == LED.KIND]
+        self.loads = [self.components[i] for i in self.plan.loads]
+        self.sources = [self.components[i] for i in self.plan.sources]
+        self.capacitors = [self.components[i] for i in self.plan.capacitors]
+        self.inductors = [self.components[i] for i in self.plan.inductors]
+
+        self.gnd_idx = self.active_nodes.index(0) if 0 in self.active_nodes else 0
+        self.keep = np.arange(self.plan.size) != self.gnd_idx
+        # Least recently used first
+        self._factors = OrderedDict()
+        self._propagators = OrderedDict()
+        # LEDs are the only nonlinear components
+        self.diodes = DiodeNewton(self) if len(self.led_rows) else None
+
+    @property
+    def is_linear(self):
+        # Linear circuits step as an affine map of their state (see StepPropagator, BatchedCircuit)
+        return self.diodes is None
+
+    @property
+    def incidence_matrix(self):
+        # Built on first use; CSR on the sparse backend since it is almost all zeros
+        if self._incidence_matrix is None:
+            if self.backend == "sparse":
+                self._incidence_matrix = generate_sparse_incidence_matrix(self.components, self.active_nodes)
             else:
-                component.voltage_drop = v_drop
-                if component.resistance > 0:
-                    component.current = v_drop / component.resistance
-                else:
-                    component.current = 0
-            
-            if isinstance(component, LED):
-                component.brightness = calculate_brightness(component)
-    
-    return full_voltages, battery_currents
+                self._incidence_matrix = generate_incidence_matrix(self.components, self.active_nodes)
+        return self._incidence_matrix
+
+    def system_matrix(self, dt):
+        # Ground-reduced MNA matrix for this dt
+        g = self.plan.load_conductances(self.table, self.rows, dt)
+        if self.backend == "sparse":
+            keep = np.flatnonzero(self.keep)
+            return self.plan.assemble_sparse(g)[keep][:, keep]
+        Master = self.plan.assemble(g)
+        return Master[np.ix_(self.keep, self.keep)]
+
+    def factorization(self, dt):
+        # Linear components make the matrix depend only on dt, so factor it once per dt
+        factor = self._factors.get(dt)
+        if factor is None:
+            if self.backend == "sparse":
+                factor = SparseFactorization(self.system_matrix(dt))
+            else:
+                factor = Factorization(self.system_matrix(dt))
+            if len(self._factors) >= self.MAX_CACHED_FACTORIZATIONS:
+                self._factors.popitem(last=False)
+            self._factors[dt] = factor
+        else:
+            self._factors.move_to_end(dt)
+        return factor
+
+    def propagator(self, dt):
+        # Closed-form N-step map for this dt, built on first use
+        propagator = self._propagators.get(dt)
+        if propagator is None:
+            propagator = StepPropagator(self, dt)
+            if len(self._propagators) >= self.MAX_CACHED_FACTORIZATIONS:
+                self._propagators.popitem(last=False)
+            self._propagators[dt] = propagator
+        else:
+            self._propagators.move_to_end(dt)
+        return propagator
+
+    def update_values(self):
+        # Component values were edited in place, refactor on the next step
+        self._factors.clear()
+        self._propagators.clear()
+
+    def save_state(self):
+        # Reactive state vector: capacitor voltages and currents, inductor currents and voltages
+        t = self.table
+        return np.concatenate([t.prev_voltage_drop[self.cap_rows], t.current[self.cap_rows],
+                               t.prev_current[self.ind_rows], t.prev_voltage_drop_signed[self.ind_rows]])
+
+    def restore_state(self, state):
+        t = self.table
+        nc = len(self.cap_rows)
+        ni = len(self.ind_rows)
+        t.prev_voltage_drop[self.cap_rows] = t.voltage_drop[self.cap_rows] = state[:nc]
+        t.current[self.cap_rows] = state[nc:2*nc]
+        t.prev_current[self.ind_rows] = t.current[self.ind_rows] = state[2*nc:2*nc + ni]
+        t.prev_voltage_drop_signed[self.ind_rows] = t.voltage_drop[self.ind_rows] = state[2*nc + ni:]
+
+    def dc_plan(self):
+        # Operating-point topology: capacitors open, inductors as 0 V sources so their current is solved for
+        if self._dc_plan is None:
+            plan = self.plan
+            kinds = plan.kinds.copy()
+            kinds[plan.inductors] = SOURCE
+            idx1 = plan.idx1.copy()
+            idx2 = plan.idx2.copy()
+            idx1[plan.capacitors] = idx2[plan.capacitors] = -1
+            self._dc_plan = StampPlan(kinds, idx1, idx2, self.num_nodes)
+        return self._dc_plan
+
+    def operating_point(self):
+        '''
+        DC steady state in a single solve, without the companion models: capacitors are open and
+        inductors are shorted by 0 V sources whose currents become the inductor currents.
+        The result is written into the component state so a transient can start from it.
+        Returns (full_voltages, branch_currents) like step().
+        '''
+        plan = self.dc_plan()
+        t = self.table
+        # No reactive loads are left, so dt does not matter
+        g = plan.load_conductances(t, self.rows, 1.0)
+        source_rows = self.rows[plan.sources]
+        is_inductor = t.kind[source_rows] == Inductor.KIND
+
+        # A tiny series resistance proportional to L keeps loops of inductors solvable; their current then
+        # splits in inverse proportion to L, as it does when starting from zero flux
+        k = self.num_nodes + np.flatnonzero(is_inductor)
+        r = np.maximum(t.value[source_rows[is_inductor]], 0.0) / GMAX
+        keep = np.flatnonzero(np.arange(plan.size) != self.gnd_idx)
+        if self.backend == "sparse":
+            M = plan.assemble_sparse(g) - sparse.csr_matrix((r, (k, k)), shape=(plan.size, plan.size))
+            factor = SparseFactorization(M[keep][:, keep])
+        else:
+            M = plan.assemble(g)
+            M[k, k] -= r
+            factor = Factorization(M[np.ix_(keep, keep)])
+
+        Z = np.zeros(plan.size)
+        Z[self.num_nodes:] = np.where(t.kind[source_rows] == Battery.KIND, t.value[source_rows], 0.0)
+        x = factor.solve(Z[keep])
+        if self.diodes is not None:
+            x = self.diodes.solve(factor, x)
+
+        n = self.num_nodes
+        full_voltages = np.insert(x[:n-1], self.gnd_idx, 0.0)
+        # Source currents are positive from node_id_2 to node_id_1 through the source, inductor currents the other way
+        source_currents = x[n-1:]
+        t.current[source_rows] = np.where(is_inductor, -source_currents, source_currents)
+
+        padded = np.append(full_voltages, 0.0)
+        v_drops = padded[self.plan.idx1] - padded[self.plan.idx2]
+        t.voltage_drop[self.load_rows] = v_drops[self.plan.loads]
+
+        caps = self.cap_rows
+        t.prev_voltage_drop[caps] = t.voltage_drop[caps]
+        t.current[caps] = 0.0
+        inds = self.ind_rows
+        t.prev_current[inds] = t.current[inds]
+        t.prev_voltage_drop_signed[inds] = t.voltage_drop[inds]
+
+        res = self.res_rows
+        resistance = t.value[res]
+        positive = resistance > 0
+        t.current[res] = np.where(positive, t.voltage_drop[res] / np.where(positive, resistance, 1.0), 0.0)
+        leds = self.led_rows
+        if self.diodes is not None:
+            t.current[leds] = self.diodes.currents
+        t.brightness[leds] = led_brightness(t.current[leds])
+        return full_voltages, self.branch_currents()
+
+    def ac_response(self, frequencies, source=None):
+        '''
+        Small-signal node voltages for a 1 V AC excitation of one battery (default: the first one), with
+        every other battery shorted. The admittance matrix is G + jωC + Γ/(jω) with G, C and Γ assembled
+        once, and all frequencies are solved together. LEDs enter with their small-signal conductance at
+        the present junction voltages, e.g. after operating_point(). Returns a (frequencies x nodes) complex array
+        following active_nodes, i.e. the transfer function from the source to every node.
+        '''
+        if not self.sources:
+            raise ValueError("AC analysis needs a Battery to excite")
+        k = 0 if source is None else self.sources.index(source)
+        omega = 2 * np.pi * np.atleast_1d(np.asarray(frequencies, dtype=float))
+        if np.any(omega <= 0):
+            # Inductors enter as 1/(jω), which has no value at DC; use operating_point() there
+            raise ValueError("AC analysis needs positive frequencies")
+
+        plan = self.plan
+        kinds = plan.kinds[plan.loads]
+        values = self.table.value[self.rows[plan.loads]]
+        positive = values > 0
+        safe = np.where(positive, values, 1.0)
+        # Resistors (and shorted inductors) are real conductances, capacitors scale with jω, inductors with 1/(jω)
+        g_real = np.where(kinds == RESISTIVE, np.where(positive, 1 / safe, GMAX), 0.0)
+        g_real = np.where((kinds == INDUCTIVE) & ~positive, GMAX, g_real)
+        if self.diodes is not None:
+            g_real[self.table.kind[self.load_rows] == LED.KIND] = self.diodes.conductance()
+        g_cap = np.where(kinds == CAPACITIVE, values, 0.0)
+        g_ind = np.where((kinds == INDUCTIVE) & positive, 1 / safe, 0.0)
+
+        keep = np.flatnonzero(self.keep)
+        Z = np.zeros(plan.size, dtype=complex)
+        Z[self.num_nodes + k] = 1.0
+        Z = Z[keep]
+
+        n = self.num_nodes
+        x = np.zeros((len(omega), len(keep)), dtype=complex)
+        if self.backend == "sparse":
+            G = plan.assemble_sparse(g_real)[keep][:, keep]
+            C = plan.assemble_sparse(g_cap, sources=False)[keep][:, keep]
+            L = plan.assemble_sparse(g_ind, sources=False)[keep][:, keep]
+            for i, w in enumerate(omega):
+                x[i] = SparseFactorization(G + (1j * w) * C + L / (1j * w)).solve(Z)
+        else:
+            G = plan.assemble(g_real)[np.ix_(keep, keep)]
+            C = plan.assemble(g_cap, sources=False)[np.ix_(keep, keep)]
+            L = plan.assemble(g_ind, sources=False)[np.ix_(keep, keep)]
+            # Stacked (chunk x size x size) systems, chunked to bound memory on large circuits
+            chunk = max(1, int(4e6 // max(1, len(keep)) ** 2))
+            for start in range(0, len(omega), chunk):
+                w = omega[start:start + chunk, None, None]
+                Y = G + (1j * w) * C + L / (1j * w)
+                try:
+                    x[start:start + chunk] = np.linalg.solve(Y, np.broadcast_to(Z, (len(Y), len(Z)))[..., None])[..., 0]
+                except np.linalg.LinAlgError:
+                    for i, Y_i in enumerate(Y):
+                        x[start + i] = Factorization(Y_i).solve(Z)
+        return np.insert(x[:, :n-1], self.gnd_idx, 0.0, axis=1)
+
+    def branch_currents(self):
+        # Current of every component, in self.components order
+        return self.table.current[self.rows].copy()
+
+    def reactive_values(self, state):
+        # The integrated quantities of a state vector: capacitor voltages then inductor currents
+        nc = len(self.capacitors)
+        return np.concatenate([state[:nc], state[2*nc:2*nc + len(self.inductors)]])
+
+    def __deepcopy__(self, memo):
+        # Copied components get rows of their own in a new table, so compile again against those rows
+        return CompiledCircuit(copy.deepcopy(self.components, memo), self.active_nodes, backend=self.backend)
+
+    def __getstate__(self):
+        # Factorizations are cheap to redo and SuperLU objects do not pickle (e.g. for process pools)
+        state = self.__dict__.copy()
+        state['_factors'] = OrderedDict()
+        state['_propagators'] = OrderedDict()
+        return state
+
+    def step(self, dt):
+        Z = self.plan.rhs(self.table, self.rows, dt)
+
+        # Solve for Voltages
+        factor = self.factorization(dt)
+        x = factor.solve(Z[self.keep])
+        if self.diodes is not None:
+            x = self.diodes.solve(factor, x)
+
+        n = self.num_nodes
+        full_voltages = np.insert(x[:n-1], self.gnd_idx, 0.0)
+        battery_currents = x[n-1:]
+        self.write_back(full_voltages, battery_currents, dt)
+        return full_voltages, battery_currents
+
+    def write_back(self, full_voltages, battery_currents, dt):
+        # Per-class array updates on the table columns; component attributes read them on demand
+        t = self.table
+        plan = self.plan
+        t.current[self.source_rows] = battery_currents
+
+        # Voltage drop from node1 to node2 for every branch, nodes outside active_nodes read as 0 V
+        padded = np.append(full_voltages, 0.0)
+        v_drops = padded[plan.idx1] - padded[plan.idx2]
+        t.voltage_drop[self.load_rows] = v_drops[plan.loads]
+
+        caps = self.cap_rows
+        v = v_drops[plan.capacitors]
+        t.current[caps] = (2 * t.value[caps] / dt) * (v - t.prev_voltage_drop[caps]) - t.current[caps]
+        t.prev_voltage_drop[caps] = v
+
+        inds = self.ind_rows
+        v = v_drops[plan.inductors]
+        G_eq = branch_conductances(INDUCTIVE, t.value[inds], dt)
+        t.current[inds] = G_eq * v + t.prev_current[inds] + G_eq * t.prev_voltage_drop_signed[inds]
+        t.prev_voltage_drop_signed[inds] = v
+        t.prev_current[inds] = t.current[inds]
+
+        res = self.res_rows
+        resistance = t.value[res]
+        positive = resistance > 0
+        t.current[res] = np.where(positive, v_drops[plan.resistors] / np.where(positive, resistance, 1.0), 0.0)
+
+        leds = self.led_rows
+        if self.diodes is not None:
+            t.current[leds] = self.diodes.currents
+        t.brightness[leds] = led_brightness(t.current[leds])
+
+class StepPropagator:
+    '''
+    N fixed-dt steps of a linear CompiledCircuit in closed form: one step is an affine map of the
+    reactive state, so N steps are applied by repeated squaring in O(n^2 log N).
+    '''
+    def __init__(self, compiled, dt):
+        if not compiled.is_linear:
+            raise ValueError("StepPropagator needs a linear circuit (no LEDs)")
+        self.compiled = compiled
+        self.dt = dt
+        saved = compiled.save_state()
+        size = len(saved)
+
+        compiled.restore_state(np.zeros(size))
+        compiled.step(dt)
+        gamma = compiled.save_state()
+        Phi = np.empty((size, size))
+        for j in range(size):
+            unit = np.zeros(size)
+            unit[j] = 1.0
+            compiled.restore_state(unit)
+            compiled.step(dt)
+            Phi[:, j] = compiled.save_state() - gamma
+        compiled.restore_state(saved)
+        self.powers = [(Phi, gamma)]
+
+    def power(self, k):
+        # Affine map of 2**k steps
+        while len(self.powers) <= k:
+            Phi, gamma = self.powers[-1]
+            self.powers.append((Phi @ Phi, Phi @ gamma + gamma))
+        return self.powers[k]
+
+    def advance(self, state, steps):
+        # State vector after `steps` fixed-dt steps from `state`
+        state = np.asarray(state, dtype=float)
+        k = 0
+        while steps:
+            if steps & 1:
+                Phi, gamma = self.power(k)
+                state = Phi @ state + gamma
+            steps >>= 1
+            k += 1
+        return state
+
+class CheckpointStore:
+    '''
+    Snapshots of a CompiledCircuit's reactive state keyed by simulated time, so jumping to a time
+    resumes from the nearest earlier snapshot instead of replaying from t=0. Bounded by
+    max_bytes, evicting the least recently used snapshot first.
+    '''
+    def __init__(self, interval, max_bytes=16 * 1024 * 1024):
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._states = OrderedDict()
+        self._times = []
+
+    def __len__(self):
+        return len(self._states)
+
+    def save(self, t, state):
+        if t in self._states:
+            self.nbytes -= self._states.pop(t).nbytes
+        else:
+            bisect.insort(self._times, t)
+        state = np.array(state, dtype=float)
+        self._states[t] = state
+        self.nbytes += state.nbytes
+        while self.nbytes > self.max_bytes and len(self._states) > 1:
+            old_t, old_state = self._states.popitem(last=False)
+            self._times.remove(old_t)
+            self.nbytes -= old_state.nbytes
+
+    def latest_before(self, t):
+        # (time, state) of the last snapshot strictly before t, or (0.0, None)
+        i = bisect.bisect_left(self._times, t) - 1
+        if i < 0:
+            return 0.0, None
+        t0 = self._times[i]
+        self._states.move_to_end(t0)
+        return t0, self._states[t0].copy()
+
+    def due(self, t):
+        # True when no snapshot exists within one interval before t
+        i = bisect.bisect_right(self._times, t) - 1
+        return i < 0 or t - self._times[i] >= self.interval
+
+    def clear(self):
+        self._states.clear()
+        self._times.clear()
+        self.nbytes = 0
+
+class AdaptiveStepper:
+    '''
+    Variable-step trapezoidal integration of a CompiledCircuit with local truncation error
+    control. The LTE of every capacitor voltage and inductor current is estimated from the
+    third divided difference of the last accepted points, LTE = dt^3/12 * d3x/dt3 (by step halving
+    for the first two steps, before three points exist), and dt grows or shrinks to keep it within
+    abstol + reltol*|x|. dt only moves in powers of two of the base dt so the per-dt factorization
+    cache keeps hitting.
+    '''
+    SAFETY = 0.9
+    MIN_LEVEL = -6
+    MAX_LEVEL = 10
+
+    def __init__(self, compiled, dt, reltol=1e-4, abstol=1e-6, dt_min=None, dt_max=None):
+        self.compiled = compiled
+        self.dt_base = dt
+        self.reltol = reltol
+        self.abstol = abstol
+        self.level = 0
+        self.min_level = int(np.ceil(np.log2(dt_min / dt))) if dt_min else self.MIN_LEVEL
+        self.max_level = int(np.floor(np.log2(dt_max / dt))) if dt_max else self.MAX_LEVEL
+        self.min_level = min(self.min_level, 0)
+        self.max_level = max(self.max_level, self.min_level)
+        self.t = 0.0
+        self.steps = 0
+        self.rejected = 0
+        self.forced = 0  # steps accepted over tolerance at min_level
+        self.remainder = None  # last final step shorter than dt
+        self.history = [(0.0, compiled.reactive_values(compiled.save_state()))]
+
+    @property
+    def dt(self):
+        return self.dt_base * 2.0 ** self.level
+
+    def error_ratio(self, t_new, x_new):
+        # Worst LTE / tolerance over all reactive quantities, None until enough history exists
+        if len(x_new) == 0:
+            return 0.0
+        if len(self.history) < 3:
+            return None
+        (t0, x0), (t1, x1), (t2, x2) = self.history
+        dd1a = (x1 - x0) / (t1 - t0)
+        dd1b = (x2 - x1) / (t2 - t1)
+        dd1c = (x_new - x2) / (t_new - t2)
+        dd2a = (dd1b - dd1a) / (t2 - t0)
+        dd2b = (dd1c - dd1b) / (t_new - t1)
+        dd3 = (dd2b - dd2a) / (t_new - t0)
+        dt = t_new - t2
+        lte = 0.5 * dt**3 * np.abs(dd3)
+        return self.tolerance_ratio(lte, x_new, x2)
+
+    def tolerance_ratio(self, lte, x_new, x_old):
+        tol = self.abstol + self.reltol * np.maximum(np.abs(x_new), np.abs(x_old))
+        return float(np.max(lte / tol))
+
+    def startup_step(self, saved, dt, x_full):
+        # Before there are three points, redo the step as two halves; for a second-order method their
+        # error is about (x_half - x_full) / 3. Returns the halved result and its error ratio
+        self.compiled.restore_state(saved)
+        self.compiled.step(dt / 2)
+        voltages, _ = self.compiled.step(dt / 2)
+        x = self.compiled.reactive_values(self.compiled.save_state())
+        return voltages, x, self.tolerance_ratio(np.abs(x - x_full) / 3, x, self.history[-1][1])
+
+    def snap(self, remaining):
+        # The time left up to t_limit carries rounding from summing t, so one within a few ulps of dt or
+        # of the last remainder (e.g. repeated advance(dt_base)) reuses that dt and its cached factorization
+        for dt in (self.dt, self.remainder):
+            if dt and abs(remaining - dt) <= 1e-9 * dt:
+                return dt
+        self.remainder = remaining
+        return remaining
+
+    def step(self, t_limit=None):
+        # Take one accepted step (never past t_limit); returns the node voltages
+        while True:
+            dt = self.dt
+            final = t_limit is not None and self.t + dt >= t_limit * (1 - 1e-12)
+            if final:
+                dt = self.snap(t_limit - self.t)
+            saved = self.compiled.save_state()
+            voltages, _ = self.compiled.step(dt)
+            x = self.compiled.reactive_values(self.compiled.save_state())
+            ratio = self.error_ratio(self.t + dt, x)
+            if ratio is None:
+                voltages, x, ratio = self.startup_step(saved, dt, x)
+
+            if ratio <= 1.0 or self.level <= self.min_level:
+                if ratio > 1.0:
+                    # Accepted only because dt cannot shrink further
+                    self.forced += 1
+                self.t = t_limit if final else self.t + dt
+                self.steps += 1
+                self.history = (self.history + [(self.t, x)])[-3:]
+                if not final and self.level < self.max_level and ratio <= (self.SAFETY / 2.0) ** 3:
+                    self.level += 1
+                return voltages
+
+            self.compiled.restore_state(saved)
+            self.rejected += 1
+            shrink = self.SAFETY * ratio ** (-1/3)
+            self.level = max(self.min_level, self.level - max(1, int(np.ceil(-np.log2(shrink)))))
+
+    def advance(self, duration):
+        # Integrate exactly duration further in time; returns the number of accepted steps
+        t_end = self.t + duration
+        start = self.steps
+        while self.t < t_end * (1 - 1e-12):
+            self.step(t_end)
+        return self.steps - start
+
+class BatchedCircuit:
+    '''
+    Many value variants of one compiled topology advanced in lockstep. Every variant has the
+    same stamp pattern, so the (batch x n x n) system stack is assembled with one scatter-add,
+    factored once per dt with broadcasting, and each step is a single batched solve.
+    values is a (batch x components) table in compiled.components order (see VALUE_ATTRIBUTES).
+    '''
+    def __init__(self, compiled, values):
+        if not compiled.is_linear:
+            raise ValueError("BatchedCircuit needs a linear circuit (no LEDs)")
+        self.compiled = compiled
+        plan = compiled.plan
+        self.plan = plan
+        self.values = np.atleast_2d(np.asarray(values, dtype=float))
+        self.batch = len(self.values)
+
+        num_caps = len(plan.capacitors)
+        num_inds = len(plan.inductors)
+        # Reactive state, one row per variant (see CompiledCircuit.write_back for the update rules)
+        self.cap_voltage = np.zeros((self.batch, num_caps))
+        self.cap_current = np.zeros((self.batch, num_caps))
+        self.ind_current = np.zeros((self.batch, num_inds))
+        self.ind_voltage = np.zeros((self.batch, num_inds))
+        self.currents = np.zeros((self.batch, len(compiled.components)))
+
+        # Scatter history currents onto nodes: capacitors enter node_id_1, inductors leave it
+        n = plan.num_nodes
+        H = np.zeros((num_caps + num_inds, n + 1))
+        rows = np.arange(num_caps + num_inds)
+        signs = np.concatenate([np.ones(num_caps), -np.ones(num_inds)])
+        hist = np.concatenate([plan.capacitors, plan.inductors])
+        np.add.at(H, (rows, plan.idx1[hist]), signs)
+        np.add.at(H, (rows, plan.idx2[hist]), -signs)
+        self.history_matrix = H[:, :n]
+
+        self.constant = plan.assemble(np.zeros(len(plan.loads)))
+        self._factors = {}
+
+    def system_matrices(self, dt):
+        plan = self.plan
+        size = plan.size
+        g = branch_conductances(plan.kinds[plan.loads], self.values[:, plan.loads], dt)
+        weights = np.tile(g, (1, 4))[:, plan.g_valid] * plan.g_sign
+        flat = (np.arange(self.batch)[:, None] * size * size + plan.g_rows * size + plan.g_cols).ravel()
+        M = np.bincount(flat, weights=weights.ravel(), minlength=self.batch * size * size).reshape(self.batch, size, size)
+        M += self.constant
+        keep = np.flatnonzero(self.compiled.keep)
+        return M[:, keep[:, None], keep]
+
+    def inverse(self, dt):
+        inv = self._factors.get(dt)
+        if inv is None:
+            M = self.system_matrices(dt)
+            try:
+                inv = np.linalg.inv(M)
+            except np.linalg.LinAlgError:
+                # At least one variant is singular, invert the rest one by one and zero its solution
+                inv = np.zeros_like(M)
+                for b in range(self.batch):
+                    try:
+                        inv[b] = np.linalg.inv(M[b])
+                    except np.linalg.LinAlgError:
+                        pass
+            inv[~np.isfinite(inv).all(axis=(1, 2))] = 0.0
+            if len(self._factors) >= CompiledCircuit.MAX_CACHED_FACTORIZATIONS:
+                self._factors.pop(next(iter(self._factors)))
+            self._factors[dt] = inv
+        return inv
+
+    def step(self, dt):
+        plan = self.plan
+        n = plan.num_nodes
+        cap_g = 2 * self.values[:, plan.capacitors] / dt
+        ind_l = self.values[:, plan.inductors]
+        ind_g = np.where(ind_l > 0, dt / (2 * np.where(ind_l > 0, ind_l, 1.0)), GMAX)
+
+        cap_ieq = cap_g * self.cap_voltage + self.cap_current
+        ind_ieq = self.ind_current + ind_g * self.ind_voltage
+        Z = np.empty((self.batch, plan.size))
+        Z[:, :n] = np.concatenate([cap_ieq, ind_ieq], axis=1) @ self.history_matrix
+        Z[:, n:] = self.values[:, plan.sources]
+
+        x = np.matmul(self.inverse(dt), Z[:, self.compiled.keep][:, :, None])[:, :, 0]
+        x[np.isnan(x).any(axis=1)] = 0.0
+
+        gnd = self.compiled.gnd_idx
+        voltages = np.insert(x[:, :n-1], gnd, 0.0, axis=1)
+        self.currents[:, plan.sources] = x[:, n-1:]
+
+        padded = np.concatenate([voltages, np.zeros((self.batch, 1))], axis=1)
+        v_drops = padded[:, plan.idx1] - padded[:, plan.idx2]
+
+        v_cap = v_drops[:, plan.capacitors]
+        self.cap_current = cap_g * (v_cap - self.cap_voltage) - self.cap_current
+        self.cap_voltage = v_cap
+        v_ind = v_drops[:, plan.inductors]
+        self.ind_current = ind_g * v_ind + self.ind_current + ind_g * self.ind_voltage
+        self.ind_voltage = v_ind
+
+        r = self.values[:, plan.resistors]
+        self.currents[:, plan.resistors] = np.where(r > 0, v_drops[:, plan.resistors] / np.where(r > 0, r, 1.0), 0.0)
+        self.currents[:, plan.capacitors] = self.cap_current
+        self.currents[:, plan.inductors] = self.ind_current
+        return voltages, self.currents
+
+def ModifiedNodalAnalysis(incidence_matrix, components, active_nodes, dt=1/60.0, backend="auto"):
+    # One-off step; callers stepping an unchanged circuit should keep a CompiledCircuit instead
+    return CompiledCircuit(components, active_nodes, incidence_matrix, backend).step(dt)
+
+def dc_operating_point(components, active_nodes=None, backend="auto"):
+    # One-off DC solve; see CompiledCircuit.operating_point
+    return CompiledCircuit(components, active_nodes, backend=backend).operating_point()
 
 # Non-directional components whose behavior is symmetric regardless of node order
 NON_DIRECTIONAL = (Resistor, Inductor)
@@ -181,32 +959,63 @@ def normalize_bidirectional_components(components):
                 if component.node_id_1 > component.node_id_2:
                     component.node_id_1, component.node_id_2 = component.node_id_2, component.node_id_1
 
+def reset_circuit_state(components):
+    # Back to t=0: discharged capacitors, no inductor current, no readings
+    table, rows = ComponentTable.gather(components)
+    for column in (table.voltage_drop, table.current, table.prev_voltage_drop, table.prev_current, table.prev_voltage_drop_signed, table.junction_voltage):
+        column[rows] = 0.0
+
+# Shockley LED model: emission coefficient, thermal voltage at room temperature and the forward
+# voltage of each color at LED_RATED_CURRENT, from which the saturation current follows
+LED_EMISSION_COEFFICIENT = 2.0
+THERMAL_VOLTAGE = 0.025852
+LED_RATED_CURRENT = 0.020
+LED_FORWARD_VOLTAGES = {"red": 1.8, "orange": 2.0, "green": 2.1, "blue": 3.0}
+DEFAULT_FORWARD_VOLTAGE = 2.0
+# Forward current at which an LED reads 100% brightness; above it the LED burns out
+LED_MAX_CURRENT = 0.030
+
+def led_parameters(colors):
+    # Saturation current and emission coefficient times thermal voltage of each LED color
+    nvt = LED_EMISSION_COEFFICIENT * THERMAL_VOLTAGE
+    forward = np.array([LED_FORWARD_VOLTAGES.get(color, DEFAULT_FORWARD_VOLTAGE) for color in colors], dtype=float)
+    return LED_RATED_CURRENT / np.expm1(forward / nvt), np.full(len(forward), nvt)
+
+def limit_junction_voltage(v_new, v_old, nvt, v_crit):
+    # SPICE pnjlim: a large forward step of a junction voltage past v_crit becomes a logarithmic one,
+    # so exp() stays representable and Newton does not overshoot
+    limit = (v_new > v_crit) & (np.abs(v_new - v_old) > 2 * nvt)
+    arg = 1 + (v_new - v_old) / nvt
+    from_forward = np.where(arg > 0, v_old + nvt * np.log(np.where(arg > 0, arg, 1.0)), v_crit)
+    from_reverse = nvt * np.log(np.where(v_new > 0, v_new, nvt) / nvt)
+    return np.where(limit, np.where(v_old > 0, from_forward, from_reverse), v_new)
+
+def led_brightness(current):
+    # Light output follows the forward current: percentage of LED_MAX_CURRENT, for arrays of LED currents
+    return np.maximum(0.0, current / LED_MAX_CURRENT * 100)
+
 def calculate_brightness(led_component):
-    MAX_POWER = 0.040 
-    
-    if led_component.current <= 0:
-        return 0.0
-        
-    power = led_component.current * led_component.voltage_drop
-    
-    # Brightness as percentage of max power
-    percentage = (power / MAX_POWER) * 100
-    
-    return max(0.0, percentage)
+    return float(led_brightness(led_component.current))
 
 def generate_incidence_matrix(components, active_nodes):
     normalize_bidirectional_components(components)
     incidence_matrix = np.zeros((len(components), len(active_nodes)))
-    for i, component in enumerate(components):
-        for j, node in enumerate(active_nodes):
-            if component.node_id_1 == component.node_id_2:
-                continue
-            if component.node_id_1 == node:
-                incidence_matrix[i][j] = -1
-            elif component.node_id_2 == node:
-                incidence_matrix[i][j] = 1
+    idx1, idx2 = node_indices(components, active_nodes)
+    rows = np.arange(len(components))
+    incidence_matrix[rows[idx1 >= 0], idx1[idx1 >= 0]] = -1
+    incidence_matrix[rows[idx2 >= 0], idx2[idx2 >= 0]] = 1
     return incidence_matrix
 
+def generate_sparse_incidence_matrix(components, active_nodes):
+    # CSR version of generate_incidence_matrix for netlists with thousands of nodes
+    normalize_bidirectional_components(components)
+    idx1, idx2 = node_indices(components, active_nodes)
+    rows = np.arange(len(components))
+    data = np.concatenate([-np.ones(np.count_nonzero(idx1 >= 0)), np.ones(np.count_nonzero(idx2 >= 0))])
+    row_ind = np.concatenate([rows[idx1 >= 0], rows[idx2 >= 0]])
+    col_ind = np.concatenate([idx1[idx1 >= 0], idx2[idx2 >= 0]])
+    return sparse.csr_matrix((data, (row_ind, col_ind)), shape=(len(components), len(active_nodes)))
+
 def calculate_resistance_in_series(resistances):
     return sum(resistances)
 
@@ -218,200 +1027,216 @@ def calculate_resistance_in_parallel(resistances):
         return float('inf')
     return 1 / inverse_sum
 
-def calculate_time_constant(components):
-    resistive = [c for c in components if isinstance(c, (Resistor, LED))]
-    capacitors = [c for c in components if isinstance(c, Capacitor)]
-    inductors = [c for c in components if isinstance(c, Inductor)]
-    batteries = [c for c in components if isinstance(c, Battery)]
-    
-    has_rc = resistive and capacitors
-    has_rl = resistive and inductors
-    has_lc = inductors and capacitors
-    
-    if not has_rc and not has_rl and not has_lc:
-        return None
-    
-    all_nodes = list(set(
-        [c.node_id_1 for c in components if not isinstance(c, Wire)] +
-        [c.node_id_2 for c in components if not isinstance(c, Wire)]
-    ))
-    
-    n = len(all_nodes)
-    if n < 2:
-        return None
-    
-    Y = np.zeros((n, n))
-    for r in resistive:
-        if r.resistance > 0:
-            g = 1.0 / r.resistance
-            i = all_nodes.index(r.node_id_1)
-            j = all_nodes.index(r.node_id_2)
-            Y[i][i] += g
-            Y[j][j] += g
-            Y[i][j] -= g
-            Y[j][i] -= g
-            
-    for bat in batteries:
-        g = 1e9 
-        i = all_nodes.index(bat.node_id_1)
-        j = all_nodes.index(bat.node_id_2)
-        Y[i][i] += g
-        Y[j][j] += g
-        Y[i][j] -= g
-        Y[j][i] -= g
-        
-    taus = []
-
-
-
-    # Group parallel capacitors by their node pair
-    cap_groups = {}
-    for cap in capacitors:
-        key = (min(cap.node_id_1, cap.node_id_2), max(cap.node_id_1, cap.node_id_2))
-        if key not in cap_groups:
-            cap_groups[key] = []
-        cap_groups[key].append(cap)
-
-    #For each capacitor GROUP, compute tau with all other groups OPEN
-    for group_key, group_caps in cap_groups.items():
-        ci = all_nodes.index(group_key[0])
-        cj = all_nodes.index(group_key[1])
-        if ci == cj:
-            continue
+def circuit_fingerprint(components):
+    # Everything the time-constant analysis depends on: kind, terminals and value of each branch
+    return tuple((c.name, c.node_id_1, c.node_id_2, getattr(c, VALUE_ATTRIBUTES.get(c.name, ""), None)) for c in components)
 
-        C_total = sum(c.capacitance for c in group_caps)
+class TimeConstantAnalysis:
+    '''
+    Natural time scales of a circuit, computed once per topology/value change.
+    Exposes the Thevenin resistance seen by each capacitor group (with the other groups open and shorted),
+    the matching per-group taus, the natural frequencies of the circuit (eigenvalues of the reduced
+    capacitor-voltage/inductor-current dynamics) and tau, the slowest of them.
+    '''
+    def __init__(self, components):
+        resistive = [c for c in components if isinstance(c, (Resistor, LED))]
+        capacitors = [c for c in components if isinstance(c, Capacitor)]
+        inductors = [c for c in components if isinstance(c, Inductor)]
+        batteries = [c for c in components if isinstance(c, Battery)]
 
-        Y_cap = np.copy(Y)
-        for i in range(n):
-            Y_cap[i][i] += 1e-12
+        self.has_rc = bool(resistive and capacitors)
+        self.has_rl = bool(resistive and inductors)
+        self.has_lc = bool(inductors and capacitors)
 
-        I_vec = np.zeros(n)
-        I_vec[ci] = 1.0
-        I_vec[cj] = -1.0
+        self.nodes = []
+        self.group_capacitance = {}
+        self.thevenin_open = {}
+        self.thevenin_shorted = {}
+        self.group_taus = {}
+        self.eigenvalues = np.zeros(0, dtype=complex)
+        self.taus = []
+        self.tau = None
 
-        ref = 0
-        Y_red = np.delete(np.delete(Y_cap, ref, axis=0), ref, axis=1)
-        I_red = np.delete(I_vec, ref)
+        if not self.has_rc and not self.has_rl and not self.has_lc:
+            return
 
-        try:
-            V_red = np.linalg.solve(Y_red, I_red)
-            V_full = np.insert(V_red, ref, 0.0)
-            R_th = abs(V_full[ci] - V_full[cj])
-            tau = R_th * C_total
-            if tau > 1e-9 and tau < 1e5:
-                taus.append(tau)
-        except np.linalg.LinAlgError:
-            pass
-    
-    #Thevenin equivalent
-    #For each capacitor group, compute tau with all other groups shorted
-    group_keys = list(cap_groups.keys())
-    for gidx, group_key in enumerate(group_keys):
-        ci = all_nodes.index(group_key[0])
-        cj = all_nodes.index(group_key[1])
-        if ci == cj:
-            continue
+        all_nodes = list(set(
+            [c.node_id_1 for c in components if not isinstance(c, Wire)] +
+            [c.node_id_2 for c in components if not isinstance(c, Wire)]
+        ))
+        self.nodes = all_nodes
+        node_index = {node: k for k, node in enumerate(all_nodes)}
+
+        n = len(all_nodes)
+        if n < 2:
+            return
 
-        C_total = sum(c.capacitance for c in cap_groups[group_key])
+        Y = np.zeros((n, n))
+        for r in resistive:
+            if r.resistance > 0:
+                g = 1.0 / r.resistance
+                i = node_index[r.node_id_1]
+                j = node_index[r.node_id_2]
+                Y[i][i] += g
+                Y[j][j] += g
+                Y[i][j] -= g
+                Y[j][i] -= g
 
-        Y_cap = np.copy(Y)
-        # Short all other groups
-        for oidx, other_key in enumerate(group_keys):
-            if oidx == gidx:
-                continue
+        for bat in batteries:
             g = 1e9
-            oki = all_nodes.index(other_key[0])
-            okj = all_nodes.index(other_key[1])
-            Y_cap[oki][oki] += g
-            Y_cap[okj][okj] += g
-            Y_cap[oki][okj] -= g
-            Y_cap[okj][oki] -= g
+            i = node_index[bat.node_id_1]
+            j = node_index[bat.node_id_2]
+            Y[i][i] += g
+            Y[j][j] += g
+            Y[i][j] -= g
+            Y[j][i] -= g
 
-        for i in range(n):
-            Y_cap[i][i] += 1e-12
+        # Group parallel capacitors by their node pair
+        for cap in capacitors:
+            key = (min(cap.node_id_1, cap.node_id_2), max(cap.node_id_1, cap.node_id_2))
+            self.group_capacitance[key] = self.group_capacitance.get(key, 0.0) + cap.capacitance
 
-        I_vec = np.zeros(n)
-        I_vec[ci] = 1.0
-        I_vec[cj] = -1.0
+        # Each capacitor group sees 1 A injected across its terminals (column of B)
+        group_keys = [key for key in self.group_capacitance if key[0] != key[1]]
+        if group_keys:
+            pairs = np.array([(node_index[i], node_index[j]) for i, j in group_keys], dtype=int)
+            cols = np.arange(len(group_keys))
+            B = np.zeros((n, len(group_keys)))
+            B[pairs[:, 0], cols] = 1.0
+            B[pairs[:, 1], cols] = -1.0
 
-        ref = 0
-        Y_red = np.delete(np.delete(Y_cap, ref, axis=0), ref, axis=1)
-        I_red = np.delete(I_vec, ref)
+            ref = 0
+            Y_red = np.delete(np.delete(Y + GMIN * np.eye(n), ref, axis=0), ref, axis=1)
+            B_red = np.delete(B, ref, axis=0)
+            try:
+                #For each capacitor GROUP, compute tau with all other groups OPEN
+                # One factorization of Y against all groups at once; S[g, g] is the Thevenin resistance of group g
+                S = B_red.T @ np.linalg.solve(Y_red, B_red)
+                R_open = np.abs(np.diag(S))
+                for g, group_key in enumerate(group_keys):
+                    self.thevenin_open[group_key] = float(R_open[g])
+
+                #Thevenin equivalent
+                #For each capacitor group, compute tau with all other groups shorted
+                # Shorting group o adds GMAX·b_o·b_o^T to Y. By Sherman-Morrison-Woodbury the resistance of group g
+                # with every other group shorted is the Schur complement 1/K[g, g] - 1/GMAX, K = (S + I/GMAX)^-1
+                K = np.linalg.inv(S + np.eye(len(group_keys)) / GMAX)
+                R_shorted = np.abs(1.0 / np.diag(K) - 1.0 / GMAX)
+                for g, group_key in enumerate(group_keys):
+                    self.thevenin_shorted[group_key] = float(R_shorted[g])
+            except np.linalg.LinAlgError:
+                pass
+
+        for group_key, C_total in self.group_capacitance.items():
+            tau_open = self.thevenin_open[group_key] * C_total if group_key in self.thevenin_open else None
+            tau_shorted = self.thevenin_shorted[group_key] * C_total if group_key in self.thevenin_shorted else None
+            self.group_taus[group_key] = (tau_open, tau_shorted)
+        for tau in [t[0] for t in self.group_taus.values()] + [t[1] for t in self.group_taus.values()]:
+            if tau is not None and tau > 1e-9 and tau < 1e5:
+                self.taus.append(tau)
 
         try:
-            V_red = np.linalg.solve(Y_red, I_red)
-            V_full = np.insert(V_red, ref, 0.0)
-            R_th = abs(V_full[ci] - V_full[cj])
-            tau = R_th * C_total
-            if tau > 1e-9 and tau < 1e5:
-                taus.append(tau)
-        except np.linalg.LinAlgError:
+            self.eigenvalues = self.natural_frequencies(Y, capacitors, inductors, node_index)
+        except Exception:
             pass
 
-    try:
-        num_v = n
-        num_i = len(inductors)
-        size = num_v + num_i
-        
-        M_desc = np.zeros((size, size))
-        N_desc = np.zeros((size, size))
-        
-        # M_desc top-left is C_mat
-        C_mat = np.zeros((n, n))
-        for cap in capacitors:
-            ci = all_nodes.index(cap.node_id_1)
-            cj = all_nodes.index(cap.node_id_2)
-            C_mat[ci][ci] += cap.capacitance
-            C_mat[cj][cj] += cap.capacitance
-            C_mat[ci][cj] -= cap.capacitance
-            C_mat[cj][ci] -= cap.capacitance
-            
-        M_desc[:n, :n] = C_mat
-        
-        # M_desc bottom-right is L_mat
-        for k, ind in enumerate(inductors):
-            M_desc[n+k, n+k] = ind.inductance
-            
-        # N_desc top-left is Y matrix
-        N_desc[:n, :n] = Y
-        
-        # N_desc top-right is A_L and bottom-left is -A_L^T
-        for k, ind in enumerate(inductors):
-            ci = all_nodes.index(ind.node_id_1)
-            cj = all_nodes.index(ind.node_id_2)
-            
-            # Current flows from node_id_1 to node_id_2
-            N_desc[ci, n+k] += 1.0
-            N_desc[cj, n+k] -= 1.0
-            
-            N_desc[n+k, ci] -= 1.0
-            N_desc[n+k, cj] += 1.0
-
-        # Remove reference node block
-        ref = 0
-        M_eig = np.delete(np.delete(M_desc, ref, axis=0), ref, axis=1)
-        N_eig = np.delete(np.delete(N_desc, ref, axis=0), ref, axis=1)
-        
-        for i in range(len(M_eig)):
-            if M_eig[i][i] == 0:
-                M_eig[i][i] = 1e-15
-                
-        for i in range(len(N_eig)):
-            if N_eig[i][i] == 0:
-                N_eig[i][i] += 1e-12
-        
-        # Solve generalized eigenvalue problem: N·X = λ·M·X
-        eigenvalues, _ = np.linalg.eig(np.linalg.solve(M_eig, N_eig))
-        
-        for ev in eigenvalues:
+        for ev in self.eigenvalues:
             if np.isfinite(ev) and abs(ev) > 1e-8:
                 # Use damped frequency Im(lambda) if oscillating, else real eigenvalue
                 omega = abs(ev.imag) if abs(ev.imag) > 1e-8 else abs(ev.real)
                 if omega > 1e-8:
                     tau_ev = 1.0 / omega
                     if tau_ev > 1e-12 and tau_ev < 1e5:
-                        taus.append(tau_ev)
-    except Exception:
-        pass
-            
-    return max(taus) if taus else None
\ No newline at end of file
+                        self.taus.append(tau_ev)
+
+        self.tau = max(self.taus) if self.taus else None
+
+    @staticmethod
+    def natural_frequencies(Y, capacitors, inductors, node_index):
+        # Eigenvalues s of the descriptor system C v' + Y v + A_L i = 0, L i' = A_L^T v.
+        # Node voltages outside the range of C have no dynamics of their own; they are eliminated by
+        # Schur complement so that only the reduced subspace (independent capacitor voltages plus
+        # inductor currents) is eigendecomposed. Inductors without inductance carry no state and,
+        # like in the resistive analysis, are left open.
+        inductors = [ind for ind in inductors if ind.inductance > 0]
+        n = len(node_index)
+        C = np.zeros((n, n))
+        for cap in capacitors:
+            ci = node_index[cap.node_id_1]
+            cj = node_index[cap.node_id_2]
+            C[ci][ci] += cap.capacitance
+            C[cj][cj] += cap.capacitance
+            C[ci][cj] -= cap.capacitance
+            C[cj][ci] -= cap.capacitance
+
+        # Current flows from node_id_1 to node_id_2
+        A_L = np.zeros((n, len(inductors)))
+        for k, ind in enumerate(inductors):
+            A_L[node_index[ind.node_id_1], k] += 1.0
+            A_L[node_index[ind.node_id_2], k] -= 1.0
+        L = np.array([ind.inductance for ind in inductors])
+
+        # Remove reference node
+        ref = 0
+        keep = np.arange(n) != ref
+        Y = (Y + GMIN * np.eye(n))[np.ix_(keep, keep)]
+        C = C[np.ix_(keep, keep)]
+        A_L = A_L[keep]
+
+        # C vanishes outside the nodes touched by capacitors. Within them, split into the range of C
+        # (dynamic directions V_r) and its null space V_0, e.g. capacitor clusters floating above ground
+        touched = np.flatnonzero(np.any(C != 0, axis=1))
+        untouched = np.flatnonzero(~np.any(C != 0, axis=1))
+        lam, V = np.linalg.eigh(C[np.ix_(touched, touched)])
+        dynamic = lam > 1e-12 * lam.max() if len(lam) else np.zeros(0, dtype=bool)
+        C_r = lam[dynamic]
+        V_r = V[:, dynamic]
+        V_0 = V[:, ~dynamic]
+
+        # Y and A_L in the coordinates z = V_r^T v_touched (dynamic) and w = [V_0^T v_touched, v_untouched] (algebraic)
+        Y_tt = Y[np.ix_(touched, touched)]
+        Y_tu = Y[np.ix_(touched, untouched)]
+        Y_rr = V_r.T @ Y_tt @ V_r
+        Y_r0 = np.hstack([V_r.T @ Y_tt @ V_0, V_r.T @ Y_tu])
+        Y_00 = np.block([[V_0.T @ Y_tt @ V_0, V_0.T @ Y_tu],
+                         [Y_tu.T @ V_0, Y[np.ix_(untouched, untouched)]]])
+        A_r = V_r.T @ A_L[touched]
+        A_0 = np.vstack([V_0.T @ A_L[touched], A_L[untouched]])
+
+        # Schur complement: w = -Y_00^-1 (Y_0r z + A_0 i)
+        num_r = len(C_r)
+        if len(Y_00):
+            X = np.linalg.solve(Y_00, np.hstack([Y_r0.T, A_0]))
+        else:
+            X = np.zeros((0, num_r + len(inductors)))
+        X_r = X[:, :num_r]
+        X_L = X[:, num_r:]
+
+        #   C_r z' = -(Y_rr - Y_r0 X_r) z - (A_r - Y_r0 X_L) i
+        #   L i'   = (A_r^T - A_0^T X_r) z - A_0^T X_L i
+        size = num_r + len(inductors)
+        state = np.zeros((size, size))
+        state[:num_r, :num_r] = -(Y_rr - Y_r0 @ X_r) / C_r[:, None]
+        state[:num_r, num_r:] = -(A_r - Y_r0 @ X_L) / C_r[:, None]
+        state[num_r:, :num_r] = (A_r.T - A_0.T @ X_r) / L[:, None]
+        state[num_r:, num_r:] = -(A_0.T @ X_L) / L[:, None]
+        return np.linalg.eigvals(state)
+
+ANALYSIS_CACHE_SIZE = 16
+_analysis_cache = OrderedDict()
+
+def analyze_circuit(components):
+    # Memoized TimeConstantAnalysis; recomputed only when the fingerprint changes
+    key = circuit_fingerprint(components)
+    analysis = _analysis_cache.get(key)
+    if analysis is None:
+        analysis = TimeConstantAnalysis(components)
+        _analysis_cache[key] = analysis
+        if len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+    else:
+        _analysis_cache.move_to_end(key)
+    return analysis
+
+def calculate_time_constant(components):
+    return analyze_circuit(components).tau
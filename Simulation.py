@@ -0,0 +1,351 @@
+'''
+Headless transient simulation: runs the Physics engine on a netlist without pygame.
+
+Netlist format, one component per line (blank lines and "#" comments are ignored):
+    Battery   <node_id_1> <node_id_2> <voltage>
+    Resistor  <node_id_1> <node_id_2> <resistance>
+    Capacitor <node_id_1> <node_id_2> <capacitance>
+    Inductor  <node_id_1> <node_id_2> <inductance>
+    LED       <node_id_1> <node_id_2> <color> [series resistance]
+Node 0 is ground and node_id_2 is the positive terminal of a Battery. Values accept SI
+suffixes, e.g. 4.7k, 10u, 100n.
+
+Usage:
+    python Simulation.py circuit.net --t-stop 0.01 --dt 1e-5 [-o out.csv | -o out.npy] [--adaptive]
+'''
+import argparse
+import copy
+import csv
+import multiprocessing
+import sys
+import numpy as np
+from Components import ComponentTable, Battery, Resistor, Capacitor, Inductor, LED
+from Physics import CompiledCircuit, BatchedCircuit, AdaptiveStepper, VALUE_ATTRIBUTES, component_values, reset_circuit_state
+
+SI_PREFIXES = {"G": 1e9, "M": 1e6, "k": 1e3, "m": 1e-3, "u": 1e-6, "µ": 1e-6, "n": 1e-9, "p": 1e-12}
+
+def parse_value(text):
+    if text[-1] in SI_PREFIXES:
+        return float(text[:-1]) * SI_PREFIXES[text[-1]]
+    return float(text)
+
+def parse_netlist(lines):
+    lines = list(lines)
+    # One table sized for the whole netlist, so the rows are contiguous and never regrown
+    table = ComponentTable(capacity=max(1, len(lines)))
+    components = []
+    for line_no, line in enumerate(lines, start=1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        fields = line.split()
+        if len(fields) < 4:
+            raise ValueError(f"line {line_no}: expected '<Type> <node_id_1> <node_id_2> <value>'")
+        c_type = fields[0]
+        n1, n2 = int(fields[1]), int(fields[2])
+        if c_type == "Battery":
+            components.append(Battery((0,0), (0,0), n1, n2, parse_value(fields[3]), table=table))
+        elif c_type == "Resistor":
+            components.append(Resistor((0,0), (0,0), n1, n2, parse_value(fields[3]), 0.0, table=table))
+        elif c_type == "Capacitor":
+            components.append(Capacitor((0,0), (0,0), n1, n2, parse_value(fields[3]), 0.0, table=table))
+        elif c_type == "Inductor":
+            components.append(Inductor((0,0), (0,0), n1, n2, parse_value(fields[3]), 0.0, table=table))
+        elif c_type == "LED":
+            resistance = parse_value(fields[4]) if len(fields) > 4 else 220
+            components.append(LED((0,0), (0,0), n1, n2, resistance, 0.0, fields[3], table=table))
+        else:
+            raise ValueError(f"line {line_no}: unknown component type '{c_type}'")
+    return components
+
+def load_netlist(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_netlist(f)
+
+def branch_labels(components):
+    # Component names are type names, so number them per type: Resistor1, Resistor2, ...
+    counts = {}
+    labels = []
+    for c in components:
+        counts[c.name] = counts.get(c.name, 0) + 1
+        labels.append(f"{c.name}{counts[c.name]}")
+    return labels
+
+def simulate(circuit, t_stop, dt, reset=True, backend="auto", adaptive=False, reltol=1e-4, abstol=1e-6, operating_point=False):
+    '''
+    Step a circuit (a component list or a CompiledCircuit) from t=0 to t_stop with a fixed dt.
+    Yields (t, node_voltages, branch_currents) after every step; node_voltages follow
+    circuit.active_nodes and branch_currents follow circuit.components.
+    adaptive=True starts at dt and lets an AdaptiveStepper pick every following step.
+    operating_point=True starts from the DC operating point instead of the discharged state.
+    '''
+    compiled = circuit if isinstance(circuit, CompiledCircuit) else CompiledCircuit(circuit, backend=backend)
+    if operating_point:
+        compiled.operating_point()
+    elif reset:
+        reset_circuit_state(compiled.components)
+
+    if adaptive:
+        stepper = AdaptiveStepper(compiled, dt, reltol, abstol)
+        while stepper.t < t_stop * (1 - 1e-12):
+            voltages = stepper.step(t_stop)
+            yield stepper.t, voltages, compiled.branch_currents()
+        return
+
+    steps = int(round(t_stop / dt))
+    for k in range(1, steps + 1):
+        voltages, _ = compiled.step(dt)
+        currents = compiled.branch_currents()
+        yield k * dt, voltages, currents
+
+class WaveformRecorder:
+    '''
+    Records node voltages and branch currents of a transient run into one preallocated
+    (rows x signals) float64 array. Column 0 is time; recording a step only copies floats into
+    the next row, so there is no per-step allocation.
+    '''
+    def __init__(self, compiled, steps, nodes=None, branches=None, every=1):
+        if nodes is None:
+            nodes = compiled.active_nodes
+        if branches is None:
+            branches = compiled.components
+        labels = dict(zip(map(id, compiled.components), branch_labels(compiled.components)))
+
+        self.every = max(1, int(every))
+        self.node_idx = np.array([compiled.active_nodes.index(n) for n in nodes], dtype=np.int64)
+        self.branches = list(branches)
+        self.table = compiled.table
+        self.branch_rows = np.array([c.row for c in self.branches], dtype=np.int64)
+        self.labels = ["t"] + [f"V({n})" for n in nodes] + [f"I({labels[id(c)]})" for c in self.branches]
+        self.data = np.zeros((steps // self.every, len(self.labels)))
+        self.count = 0
+        self._step = 0
+        self._v_cols = slice(1, 1 + len(self.node_idx))
+        self._i_cols = slice(1 + len(self.node_idx), len(self.labels))
+
+    def record(self, t, voltages):
+        self._step += 1
+        if self._step % self.every or self.count >= len(self.data):
+            return
+        row = self.data[self.count]
+        row[0] = t
+        np.take(voltages, self.node_idx, out=row[self._v_cols])
+        np.take(self.table.current, self.branch_rows, out=row[self._i_cols])
+        self.count += 1
+
+    @property
+    def waveforms(self):
+        return self.data[:self.count]
+
+    def signal(self, label):
+        # e.g. recorder.signal("V(2)") or recorder.signal("I(Capacitor1)")
+        return self.waveforms[:, self.labels.index(label)]
+
+    def save_npy(self, path):
+        np.save(path, self.waveforms)
+
+    def save_csv(self, path):
+        np.savetxt(path, self.waveforms, delimiter=",", header=",".join(self.labels), comments="", fmt="%.9e")
+
+def record(circuit, t_stop, dt, nodes=None, branches=None, every=1, reset=True, backend="auto", operating_point=False):
+    # Run a transient straight into a WaveformRecorder instead of yielding every step
+    compiled = circuit if isinstance(circuit, CompiledCircuit) else CompiledCircuit(circuit, backend=backend)
+    if operating_point:
+        compiled.operating_point()
+    elif reset:
+        reset_circuit_state(compiled.components)
+
+    steps = int(round(t_stop / dt))
+    recorder = WaveformRecorder(compiled, steps, nodes, branches, every)
+    for k in range(1, steps + 1):
+        voltages, _ = compiled.step(dt)
+        recorder.record(k * dt, voltages)
+    return recorder
+
+# Per-process copy of the compiled circuit, sent once through the pool initializer
+_worker_job = None
+
+def _init_worker(job):
+    global _worker_job
+    _worker_job = job
+
+def _run_variant(values):
+    compiled, targets, t_stop, dt, nodes, branches, every = _worker_job
+    for index, value in zip(targets, values):
+        component = compiled.components[index]
+        setattr(component, VALUE_ATTRIBUTES[component.name], float(value))
+    compiled.update_values()
+    branch_objects = None if branches is None else [compiled.components[i] for i in branches]
+    return record(compiled, t_stop, dt, nodes, branch_objects, every).waveforms
+
+def component_indices(compiled, items):
+    # Components may be given as objects from compiled.components or as indices into it
+    position = {id(c): i for i, c in enumerate(compiled.components)}
+    return [item if isinstance(item, int) else position[id(item)] for item in items]
+
+def run_batched(compiled, targets, value_table, t_stop, dt, nodes=None, branches=None, every=1):
+    # All variants advanced together by one BatchedCircuit: one Python loop over steps in total
+    values = np.tile(component_values(compiled.components), (len(value_table), 1))
+    values[:, targets] = value_table
+    batched = BatchedCircuit(compiled, values)
+
+    if nodes is None:
+        nodes = compiled.active_nodes
+    if branches is None:
+        branches = list(range(len(compiled.components)))
+    node_idx = np.array([compiled.active_nodes.index(n) for n in nodes], dtype=np.int64)
+    branch_idx = np.array(branches, dtype=np.int64)
+
+    every = max(1, int(every))
+    steps = int(round(t_stop / dt))
+    data = np.zeros((len(value_table), steps // every, 1 + len(node_idx) + len(branch_idx)))
+    row = 0
+    for k in range(1, steps + 1):
+        voltages, currents = batched.step(dt)
+        if k % every or row >= data.shape[1]:
+            continue
+        data[:, row, 0] = k * dt
+        data[:, row, 1:1 + len(node_idx)] = voltages[:, node_idx]
+        data[:, row, 1 + len(node_idx):] = currents[:, branch_idx]
+        row += 1
+    return data
+
+def run_variants(circuit, targets, value_table, t_stop, dt, nodes=None, branches=None, every=1, processes=None, batched=False, backend="auto"):
+    '''
+    Simulate one transient per row of value_table (variants x targets), where targets are the
+    components whose value each column sets. The topology is compiled once and shipped to
+    each worker process once; tasks only carry their row of values.
+    Returns (labels, waveforms) with waveforms stacked as (variants x rows x signals).
+    processes=1 runs serially in this process; batched=True instead advances every variant in
+    lockstep with stacked linear algebra (see BatchedCircuit); circuits with LEDs are not linear
+    and run per variant instead.
+    '''
+    compiled = circuit if isinstance(circuit, CompiledCircuit) else CompiledCircuit(circuit, backend=backend)
+    targets = component_indices(compiled, targets)
+    if branches is not None:
+        branches = component_indices(compiled, branches)
+    value_table = np.asarray(value_table, dtype=float).reshape(-1, len(targets))
+
+    labels = WaveformRecorder(compiled, 0, nodes, None if branches is None else [compiled.components[i] for i in branches]).labels
+    if batched and compiled.is_linear:
+        return labels, run_batched(compiled, targets, value_table, t_stop, dt, nodes, branches, every)
+
+    job = (copy.deepcopy(compiled), targets, t_stop, dt, nodes, branches, every)
+    if processes == 1 or len(value_table) <= 1:
+        _init_worker(job)
+        results = [_run_variant(values) for values in value_table]
+    else:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(job,)) as pool:
+            chunksize = max(1, len(value_table) // (4 * (processes or multiprocessing.cpu_count())))
+            results = pool.map(_run_variant, value_table, chunksize)
+    return labels, np.stack(results)
+
+def sweep(circuit, target, values, t_stop, dt, **kwargs):
+    # One component (object or index) swept over values
+    return run_variants(circuit, [target], np.asarray(values, dtype=float)[:, None], t_stop, dt, **kwargs)
+
+def monte_carlo(circuit, tolerances, runs, t_stop, dt, seed=None, **kwargs):
+    '''
+    Tolerance Monte Carlo: tolerances maps components (or indices) to a relative tolerance,
+    e.g. {r1: 0.05, c1: 0.2}; every run draws each value uniformly within +/- its tolerance.
+    Returns (labels, values, waveforms) where values holds the drawn (runs x targets) table.
+    '''
+    compiled = circuit if isinstance(circuit, CompiledCircuit) else CompiledCircuit(circuit, backend=kwargs.pop("backend", "auto"))
+    targets = component_indices(compiled, tolerances)
+    nominal = np.array([getattr(compiled.components[i], VALUE_ATTRIBUTES[compiled.components[i].name]) for i in targets])
+    tol = np.array(list(tolerances.values()))
+    rng = np.random.default_rng(seed)
+    values = nominal * (1 + tol * rng.uniform(-1.0, 1.0, size=(runs, len(targets))))
+    labels, waveforms = run_variants(compiled, targets, values, t_stop, dt, **kwargs)
+    return labels, values, waveforms
+
+def bode(response):
+    # Magnitude in dB (floored at -400 dB where a node does not respond) and unwrapped phase in degrees
+    magnitude_db = 20 * np.log10(np.maximum(np.abs(response), 1e-20))
+    phase_deg = np.degrees(np.unwrap(np.angle(response), axis=0))
+    return magnitude_db, phase_deg
+
+def ac_sweep(circuit, f_start, f_stop, points_per_decade=20, nodes=None, source=None, backend="auto"):
+    '''
+    Small-signal frequency response over a log-spaced grid from f_start to f_stop (Hz), excited by a
+    1 V AC source in place of one battery (default: the first). LEDs are linearized at the DC operating
+    point. Returns (frequencies, magnitude_db, phase_deg), the last two as (frequencies x nodes) arrays
+    for the chosen nodes (default: all).
+    '''
+    if f_start <= 0 or f_stop <= 0:
+        raise ValueError("AC sweep frequencies must be positive")
+    compiled = circuit if isinstance(circuit, CompiledCircuit) else CompiledCircuit(circuit, backend=backend)
+    if not compiled.is_linear:
+        # ac_response linearizes LEDs at their stored junction voltage, which is 0 V (open) until biased
+        compiled.operating_point()
+    points = max(2, int(round(np.log10(f_stop / f_start) * points_per_decade)) + 1)
+    frequencies = np.logspace(np.log10(f_start), np.log10(f_stop), points)
+    response = compiled.ac_response(frequencies, source)
+    if nodes is not None:
+        response = response[:, [compiled.active_nodes.index(n) for n in nodes]]
+    magnitude_db, phase_deg = bode(response)
+    return frequencies, magnitude_db, phase_deg
+
+def write_ac_csv(nodes, frequencies, magnitude_db, phase_deg, out):
+    writer = csv.writer(out)
+    writer.writerow(["f"] + [f"|V({node})| dB" for node in nodes] + [f"phase(V({node})) deg" for node in nodes])
+    for f, mag, phase in zip(frequencies, magnitude_db, phase_deg):
+        writer.writerow([f"{f:.9e}"] + [f"{m:.9e}" for m in mag] + [f"{p:.9e}" for p in phase])
+
+def write_csv(compiled, rows, out, every=1):
+    writer = csv.writer(out)
+    header = ["t"] + [f"V({node})" for node in compiled.active_nodes] + [f"I({label})" for label in branch_labels(compiled.components)]
+    writer.writerow(header)
+    for k, (t, voltages, currents) in enumerate(rows, start=1):
+        if k % every:
+            continue
+        writer.writerow([f"{t:.9e}"] + [f"{v:.9e}" for v in voltages] + [f"{i:.9e}" for i in currents])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a headless transient simulation of a netlist.")
+    parser.add_argument("netlist", help="netlist file")
+    parser.add_argument("--t-stop", type=float, help="simulated end time in seconds")
+    parser.add_argument("--dt", type=float, help="fixed timestep in seconds")
+    parser.add_argument("-o", "--output", help="CSV output file, or .npy for a recorded waveform array (default: CSV on stdout)")
+    parser.add_argument("--every", type=int, default=1, help="write every Nth step")
+    parser.add_argument("--backend", choices=["auto", "dense", "sparse"], default="auto")
+    parser.add_argument("--adaptive", action="store_true", help="LTE-controlled timestep starting from --dt (CSV output only)")
+    parser.add_argument("--reltol", type=float, default=1e-4)
+    parser.add_argument("--abstol", type=float, default=1e-6)
+    parser.add_argument("--op", action="store_true", help="only solve the DC operating point (one CSV row at t=0)")
+    parser.add_argument("--from-op", action="store_true", help="start the transient from the DC operating point")
+    parser.add_argument("--ac", nargs=2, type=parse_value, metavar=("F_START", "F_STOP"), help="AC sweep between two frequencies (Hz) instead of a transient")
+    parser.add_argument("--points", type=int, default=20, help="AC sweep points per decade")
+    args = parser.parse_args(argv)
+    if not (args.op or args.ac) and (args.t_stop is None or args.dt is None):
+        parser.error("--t-stop and --dt are required unless --op or --ac is given")
+    if args.ac and min(args.ac) <= 0:
+        parser.error("--ac frequencies must be positive")
+    if args.adaptive and args.output and args.output.endswith(".npy"):
+        parser.error("--adaptive writes CSV only; recorded .npy waveforms use the fixed --dt")
+
+    compiled = CompiledCircuit(load_netlist(args.netlist), backend=args.backend)
+    if args.ac:
+        frequencies, magnitude_db, phase_deg = ac_sweep(compiled, args.ac[0], args.ac[1], args.points)
+        if args.output:
+            with open(args.output, "w", newline="", encoding="utf-8") as out:
+                write_ac_csv(compiled.active_nodes, frequencies, magnitude_db, phase_deg, out)
+        else:
+            write_ac_csv(compiled.active_nodes, frequencies, magnitude_db, phase_deg, sys.stdout)
+        return
+    if args.op:
+        voltages, currents = compiled.operating_point()
+        rows = [(0.0, voltages, currents)]
+    elif args.output and args.output.endswith(".npy"):
+        record(compiled, args.t_stop, args.dt, every=args.every, operating_point=args.from_op).save_npy(args.output)
+        return
+    else:
+        rows = simulate(compiled, args.t_stop, args.dt, adaptive=args.adaptive, reltol=args.reltol, abstol=args.abstol, operating_point=args.from_op)
+    if args.output:
+        with open(args.output, "w", newline="", encoding="utf-8") as out:
+            write_csv(compiled, rows, out, args.every)
+    else:
+        write_csv(compiled, rows, sys.stdout, args.every)
+
+if __name__ == "__main__":
+    main()
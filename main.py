@@ -1,10 +1,15 @@
 import asyncio
+import bisect
 import numpy  # must be imported first for pygbag
 import pygame
+import pygame.surfarray
 import sys
 import math
+import time
+from collections import OrderedDict
 from Components import Wire, Battery, Resistor, Capacitor, Inductor, LED
-from Physics import generate_incidence_matrix, ModifiedNodalAnalysis, calculate_time_constant
+from Board import NUM_STRIPS, BoardConnectivity, strip_of
+from Physics import CompiledCircuit, AdaptiveStepper, CheckpointStore, analyze_circuit, reset_circuit_state
 # Initialize Pygame
 pygame.init()
 
@@ -47,33 +52,136 @@ BUTTON_HOVER = (96, 165, 250)
 BUTTON_SELECTED = (37, 99, 235)
 HOLE_HOVER_COLOR = (255, 200, 0)
 HOLE_SELECTED_COLOR = (0, 200, 100)
-
-
-class UnionFind:
-    def __init__(self, items):
-        self.parent = {item: item for item in items}
-        self.node_ids = {item: None for item in items}
-
-    def find(self, item):
-        if self.parent[item] != item:
-            self.parent[item] = self.find(self.parent[item])
-        return self.parent[item]
-
-    def union(self, item1, item2):
-        root1 = self.find(item1)
-        root2 = self.find(item2)
-        if root1 != root2:
-            self.parent[root2] = root1
-            return True
-        return False
-
-    def set_id(self, item, node_id):
-        root = self.find(item)
-        self.node_ids[root] = node_id
-
-    def get_id(self, item):
-        root = self.find(item)
-        return self.node_ids.get(root)
+# Clicks within this many pixels of a component or wire select it
+PICK_DISTANCE = 15
+# Rendered part sprites kept by SpriteCache, and the LED brightness step (percent) they are keyed by
+MAX_SPRITES = 256
+LED_BRIGHTNESS_STEP = 2
+# Side of the square tiles the screen is compared in to find what changed since the last frame
+DIRTY_TILE = 50
+# Wall-clock seconds per frame the simulation may spend stepping, how many current_dt slices it
+# owes per wall-clock second at speed 1, and the limits of the speed the [ and ] keys set
+SIM_BUDGET = 0.008
+SIM_SLICES_PER_SECOND = 60
+MIN_SIM_SPEED = 0.125
+MAX_SIM_SPEED = 64.0
+
+
+class SegmentIndex:
+    '''
+    Uniform grid over the screen for picking components and wires by their segment. Each item is
+    filed under every cell its bounding box, grown by PICK_DISTANCE, overlaps, so a lookup only
+    measures the few items filed under the cursor's cell. Items are added and removed as they
+    are placed and deleted.
+    '''
+    def __init__(self, cell_size=40):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.segments = {}
+
+    def cell_range(self, start, end):
+        lo_x = int((min(start[0], end[0]) - PICK_DISTANCE) // self.cell_size)
+        hi_x = int((max(start[0], end[0]) + PICK_DISTANCE) // self.cell_size)
+        lo_y = int((min(start[1], end[1]) - PICK_DISTANCE) // self.cell_size)
+        hi_y = int((max(start[1], end[1]) + PICK_DISTANCE) // self.cell_size)
+        return [(cx, cy) for cx in range(lo_x, hi_x + 1) for cy in range(lo_y, hi_y + 1)]
+
+    def add(self, item, start, end):
+        self.segments[item] = (start, end)
+        for cell in self.cell_range(start, end):
+            # dicts as ordered sets, so lookups see items in placement order
+            self.cells.setdefault(cell, {})[item] = None
+
+    def remove(self, item):
+        segment = self.segments.pop(item, None)
+        if segment is None:
+            return
+        for cell in self.cell_range(*segment):
+            items = self.cells[cell]
+            del items[item]
+            if not items:
+                del self.cells[cell]
+
+    def clear(self):
+        self.cells.clear()
+        self.segments.clear()
+
+    def candidates(self, pos):
+        # (item, start, end) of every item that can be within PICK_DISTANCE of pos
+        cell = (int(pos[0] // self.cell_size), int(pos[1] // self.cell_size))
+        return [(item,) + self.segments[item] for item in self.cells.get(cell, ())]
+
+class SpriteCache:
+    '''
+    Least recently used cache of rendered part sprites. A key holds everything the sprite's pixels
+    depend on (part type, value-derived visuals such as color bands or the brightness bucket,
+    rotation, length), so a part that did not change blits its cached surface instead of
+    drawing and rotating a new one every frame.
+    '''
+    def __init__(self, max_sprites=MAX_SPRITES):
+        self.max_sprites = max_sprites
+        self.sprites = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        # The sprite for key, built by render() on a miss
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.hits += 1
+            self.sprites.move_to_end(key)
+            return sprite
+        self.misses += 1
+        sprite = render()
+        self.sprites[key] = sprite
+        if len(self.sprites) > self.max_sprites:
+            self.sprites.popitem(last=False)
+        return sprite
+
+class SimulationScheduler:
+    '''
+    Steps the simulation by wall-clock time (speed * elapsed, in current_dt slices) within a
+    per-frame budget, dropping what does not fit instead of tying physics to the frame rate.
+    '''
+    def __init__(self, step, budget=SIM_BUDGET):
+        self.step = step
+        self.budget = budget
+        self.speed = 1.0
+        self.last = None
+        self.owed = 0.0
+        self.slices = 0
+        self.dropped = 0
+
+    def reset(self):
+        # Forget the wall clock, e.g. while paused, so resuming does not owe the paused time
+        self.last = None
+        self.owed = 0.0
+
+    def advance(self, now=None):
+        start = time.perf_counter()
+        now = start if now is None else now
+        if self.last is None:
+            elapsed = 1.0 / SIM_SLICES_PER_SECOND
+        else:
+            elapsed = now - self.last
+        self.last = now
+        self.owed += elapsed * SIM_SLICES_PER_SECOND * self.speed
+        while self.owed >= 1.0:
+            self.step()
+            self.owed -= 1.0
+            self.slices += 1
+            if time.perf_counter() - start >= self.budget:
+                break
+        if self.owed >= 1.0:
+            self.dropped += int(self.owed)
+            self.owed -= int(self.owed)
+
+def nearest_line(lines, coordinate):
+    # Index of the value closest to coordinate in the sorted list lines
+    i = bisect.bisect_left(lines, coordinate)
+    if i == len(lines) or (i > 0 and coordinate - lines[i - 1] <= lines[i] - coordinate):
+        return i - 1
+    return i
 
 class Hole:
 # Represents a hole on the breadboard
@@ -434,8 +542,8 @@ class SidePanel:
                 draw_text(f"Current: {format_si(self.component.current, 'A')}")
                 charge = self.component.capacitance * self.component.voltage_drop
                 draw_text(f"Charge: {format_si(charge, 'C')}")
+                has_lc = self.simulator.circuit_analysis().has_lc
                 tau = self.simulator.current_tau
-                has_lc = any(isinstance(c, Inductor) for c in self.simulator.components) and any(isinstance(c, Capacitor) for c in self.simulator.components)
                 if has_lc and tau:
                     import math
                     period = 2 * math.pi * tau
@@ -455,8 +563,8 @@ class SidePanel:
                 draw_text(f"Current: {format_si(self.component.current, 'A')}")
                 energy = 0.5 * self.component.inductance * self.component.current ** 2
                 draw_text(f"Energy: {format_si(energy, 'J')}")
+                has_lc = self.simulator.circuit_analysis().has_lc
                 tau = self.simulator.current_tau
-                has_lc = any(isinstance(c, Inductor) for c in self.simulator.components) and any(isinstance(c, Capacitor) for c in self.simulator.components)
                 if has_lc and tau:
                     import math
                     period = 2 * math.pi * tau
@@ -575,6 +683,7 @@ class BreadboardSimulator:
         self.hovered_hole = None
         self.components = []
         self.mergers = []
+        self.segment_index = SegmentIndex()
         self.param_widget = None
         self.selected_component = None
         self.is_simulating = False
@@ -583,14 +692,29 @@ class BreadboardSimulator:
         # Simulation state
         self.sim_time = 0.0
         self.current_tau = None
+        self.analysis = None  # TimeConstantAnalysis of the last compiled circuit
         self.current_dt = 1/60.0
         self.sim_paused = False
         self.sim_time_widget = None
+        self.compiled = None
+        self.solver_backend = "auto"  # "dense", "sparse" or "auto"
+        self.adaptive_stepping = True  # LTE-controlled dt instead of fixed substeps
+        self.fast_jump = True  # closed-form jump_to_time for linear (LED-free) circuits
+        self.stepper = None
+        self.checkpoints = None
+        self.record_checkpoints = False  # only while the state is a clean replay from t=0
+        self.scheduler = SimulationScheduler(self.advance_simulation)
 
         # Create UI
         self.create_buttons()
         self.create_holes()
         self.load_assets()
+
+        # Static board drawn once; frames start from it and only changed tiles reach the display
+        self.board_layer = self.render_board_layer()
+        self.sprites = SpriteCache()
+        self.last_frame = None
+        self.presented_size = None
         
         self.side_panel = SidePanel(920, 150, 260, 450, self)
         
@@ -635,11 +759,10 @@ class BreadboardSimulator:
                 self.component_images[name] = None
 
     def get_hole_pos(self, row, col):
-        # Find hole by row/col
-        for hole in self.holes:
-            if hole.row == row and hole.col == col:
-                return (hole.x, hole.y)
-        return (0, 0)
+        hole = self.hole_grid.get((row, col))
+        if hole is None:
+            return (0, 0)
+        return (hole.x, hole.y)
     def distance_point_to_segment(self, point, start, end):
         px, py = point
         x1, y1 = start
@@ -659,14 +782,10 @@ class BreadboardSimulator:
         return ((px - closest_x)**2 + (py - closest_y)**2)**0.5
 
     def get_component_at_pos(self, pos):
-        all_items = self.components + self.mergers
-        
-        closest_dist = 15
+        closest_dist = PICK_DISTANCE
         closest_item = None
         
-        for item in all_items:
-            start = self.get_hole_pos(*item.node1)
-            end = self.get_hole_pos(*item.node2)
+        for item, start, end in self.segment_index.candidates(pos):
             dist = self.distance_point_to_segment(pos, start, end)
             
             if dist < closest_dist:
@@ -690,6 +809,7 @@ class BreadboardSimulator:
         if h2: h2.occupied = False
         
         # Remove from lists
+        self.segment_index.remove(comp)
         if comp in self.components:
             self.components.remove(comp)
         if comp in self.mergers:
@@ -699,14 +819,22 @@ class BreadboardSimulator:
         self.side_panel.visible = False
         self.side_panel.component = None
         
-        # Rebuild circuit connectivity
-        self.rebuild_circuit()
+        # Only removing a wire can split a node
+        if isinstance(comp, Wire):
+            self.apply_connectivity_change(self.connectivity.remove_wire(strip_of(*comp.node1), strip_of(*comp.node2)))
+        self.invalidate_circuit()
 
     def get_hole_by_node(self, node_tuple):
         r, c = node_tuple
-        for h in self.holes:
-            if h.row == r and h.col == c:
-                return h
+        return self.hole_grid.get((r, c))
+
+    def hole_at(self, pos):
+        # Hole under a pixel: only the hole at the nearest row and column line can contain it
+        row = nearest_line(self.row_ys, pos[1])
+        col = nearest_line(self.col_xs, pos[0])
+        hole = self.hole_grid.get((self.row_ids[row], self.col_ids[col]))
+        if hole is not None and hole.contains(pos):
+            return hole
         return None
 
     def save_state(self):
@@ -722,6 +850,7 @@ class BreadboardSimulator:
     def undo(self):
         if self.history:
             state = self.history.pop()
+            removed = self.mergers
             self.components, self.mergers = state['board']
             for i, occ in enumerate(state['holes_occupied']):
                 self.holes[i].occupied = occ
@@ -731,27 +860,98 @@ class BreadboardSimulator:
             self.side_panel.visible = False
             self.side_panel.component = None
             
-            self.rebuild_circuit()
+            # Apply only the wires that differ between the two boards
+            wire_delta = {}
+            for wire in removed:
+                key = tuple(sorted((strip_of(*wire.node1), strip_of(*wire.node2))))
+                wire_delta[key] = wire_delta.get(key, 0) - 1
+            for wire in self.mergers:
+                key = tuple(sorted((strip_of(*wire.node1), strip_of(*wire.node2))))
+                wire_delta[key] = wire_delta.get(key, 0) + 1
+            changed = set()
+            for (a, b), count in wire_delta.items():
+                for _ in range(-count):
+                    changed.update(self.connectivity.remove_wire(a, b))
+                for _ in range(count):
+                    changed.update(self.connectivity.add_wire(a, b))
+            self.sync_node_ids(changed)
+            # The restored components are copies, label them all from the current nodes
+            self.relabel_components()
+            self.index_segments()
+            self.invalidate_circuit()
+
+    def index_segments(self):
+        # Picking index from scratch, for when the whole board changed
+        self.segment_index.clear()
+        for item in self.components + self.mergers:
+            self.segment_index.add(item, self.get_hole_pos(*item.node1), self.get_hole_pos(*item.node2))
 
     def rebuild_circuit(self):
+        # Connectivity from scratch, for when the whole board changed
+        self.invalidate_circuit()
+        self.index_segments()
         self.init_node_system()
-        
         for wire in self.mergers:
-             h1 = self.get_hole_by_node(wire.node1)
-             h2 = self.get_hole_by_node(wire.node2)
-             if h1 and h2:
-                 prev_id = max(h1.node_id, h2.node_id)
-                 target_id = min(h1.node_id, h2.node_id)
-                 self.uf.union(h1, h2)
-                 self.uf.set_id(h1, target_id)
-        
+            self.connectivity.add_wire(strip_of(*wire.node1), strip_of(*wire.node2))
         self.sync_node_ids()
+        self.relabel_components()
+
+    def apply_connectivity_change(self, strips):
+        # Node ids of these strips changed: refresh their holes and the components placed on them
+        if not strips:
+            return
+        self.sync_node_ids(strips)
+        self.relabel_components(set(strips))
+        self.invalidate_circuit()
 
+    def relabel_components(self, strips=None):
+        # Node ids of the components with an end on one of these strips (all when None)
         for comp in self.components:
-             h1 = self.get_hole_by_node(comp.node1)
-             h2 = self.get_hole_by_node(comp.node2)
-             if h1: comp.node_id_1 = h1.node_id
-             if h2: comp.node_id_2 = h2.node_id
+            strip = strip_of(*comp.node1)
+            if strips is None or strip in strips:
+                comp.node_id_1 = self.connectivity.node_id(strip)
+            strip = strip_of(*comp.node2)
+            if strips is None or strip in strips:
+                comp.node_id_2 = self.connectivity.node_id(strip)
+
+    def invalidate_circuit(self):
+        # Topology or values changed, recompile before the next step
+        self.compiled = None
+        self.stepper = None
+        self.checkpoints = None
+        self.analysis = None
+        self.current_tau = None
+
+    def circuit_analysis(self):
+        # TimeConstantAnalysis and current_tau of the present components, redone after an edit
+        if self.analysis is not None:
+            return self.analysis
+        self.analysis = analyze_circuit(self.components)
+        tau = self.analysis.tau
+        if tau is None or tau < 1e-6:
+            total_R = sum(c.resistance for c in self.components if isinstance(c, Resistor))
+            total_C = sum(c.capacitance for c in self.components if isinstance(c, Capacitor))
+            total_L = sum(c.inductance for c in self.components if isinstance(c, Inductor))
+            if total_R > 0 and total_C > 0:
+                tau = total_R * total_C
+            elif total_R > 0 and total_L > 0:
+                tau = total_L / total_R
+            elif total_L > 0 and total_C > 0:
+                tau = 2 * math.pi * math.sqrt(total_L * total_C)
+        self.current_tau = tau
+        return self.analysis
+
+    def compile_circuit(self):
+        if self.compiled is not None:
+            return self.compiled
+
+        self.compiled = CompiledCircuit(self.components, backend=self.solver_backend)
+        self.circuit_analysis()
+        tau = self.current_tau
+        self.current_dt = tau / 60.0 if tau else 1/60.0
+        self.checkpoints = CheckpointStore(interval=10 * self.current_dt)
+        self.record_checkpoints = self.sim_time == 0.0
+        return self.compiled
 
     def get_connected_components(self, wire):
         h1 = self.get_hole_by_node(wire.node1)
@@ -788,10 +988,7 @@ class BreadboardSimulator:
             if component.name == "Wire":
                 pygame.draw.line(self.screen, (255, 255, 0), start_pos, end_pos, 8)
             else:
-                 body_length = 40
-                 surf = pygame.Surface((length + 10, 30), pygame.SRCALPHA)
-                 pygame.draw.rect(surf, (255, 255, 0), (0, 0, length + 10, 30), border_radius=5)
-                 rotated_surf = pygame.transform.rotate(surf, angle)
+                 rotated_surf = self.sprites.get(("Selection", length, angle), lambda: self.render_selection(length, angle))
                  rect = rotated_surf.get_rect(center=(mid_x, mid_y))
                  self.screen.blit(rotated_surf, rect)
 
@@ -832,22 +1029,24 @@ class BreadboardSimulator:
         image = self.component_images.get(component.name, None)
         
         if image:
-            # Scale image to fit standard component size
-            scaled_image = pygame.transform.scale(image, (body_length, 20))
-            
-            # Rotate and center image
-            rotated_image = pygame.transform.rotate(scaled_image, angle)
+            # Scale image to fit standard component size, rotate and center it
+            rotated_image = self.sprites.get(("Image", component.name, angle), lambda: pygame.transform.rotate(pygame.transform.scale(image, (body_length, 20)), angle))
             rect = rotated_image.get_rect(center=(mid_x, mid_y))
             self.screen.blit(rotated_image, rect)
         else:
             # Fallback drawing
             self.draw_fallback_component(component, mid_x, mid_y, angle, body_length)
+
+    def render_selection(self, length, angle):
+        surf = pygame.Surface((length + 10, 30), pygame.SRCALPHA)
+        pygame.draw.rect(surf, (255, 255, 0), (0, 0, length + 10, 30), border_radius=5)
+        return pygame.transform.rotate(surf, angle)
+
     def draw_custom_battery(self, component, start_pos, end_pos, mid_x, mid_y, angle, length):
         dx = end_pos[0] - start_pos[0]
         dy = end_pos[1] - start_pos[1]
         correct_angle = math.degrees(math.atan2(-dy, dx))
         body_length = 40
-        height = 16
         
         if length > body_length:
             scale = (length - body_length) / 2 / length
@@ -856,6 +1055,13 @@ class BreadboardSimulator:
             pygame.draw.line(self.screen, (200, 50, 50), start_pos, lead1_end, 2)
             pygame.draw.line(self.screen, (50, 50, 50), lead2_start, end_pos, 2)
             
+        rotated_surf = self.sprites.get(("Battery", correct_angle), lambda: self.render_battery(correct_angle))
+        rect = rotated_surf.get_rect(center=(mid_x, mid_y))
+        self.screen.blit(rotated_surf, rect)
+
+    def render_battery(self, correct_angle):
+        body_length = 40
+        height = 16
         surf = pygame.Surface((body_length + 4, height), pygame.SRCALPHA)
         
         pygame.draw.rect(surf, (30, 30, 30), (0, 0, body_length, height), border_radius=2)
@@ -866,16 +1072,13 @@ class BreadboardSimulator:
         pygame.draw.line(surf, (0, 0, 0), (body_length - 4, height//2 - 2), (body_length - 4, height//2 + 2), 1)
         pygame.draw.line(surf, (255, 255, 255), (4, height//2), (8, height//2), 1)
         
-        rotated_surf = pygame.transform.rotate(surf, correct_angle)
-        rect = rotated_surf.get_rect(center=(mid_x, mid_y))
-        self.screen.blit(rotated_surf, rect)
+        return pygame.transform.rotate(surf, correct_angle)
 
     def draw_custom_resistor(self, component, start_pos, end_pos, mid_x, mid_y, angle, length):
         dx = end_pos[0] - start_pos[0]
         dy = end_pos[1] - start_pos[1]
         correct_angle = math.degrees(math.atan2(-dy, dx))
         body_length = 40
-        height = 15
         
         if length > body_length:
             scale = (length - body_length) / 2 / length
@@ -885,6 +1088,14 @@ class BreadboardSimulator:
             pygame.draw.line(self.screen, (150, 150, 150), start_pos, lead1_end, 2)
             pygame.draw.line(self.screen, (150, 150, 150), lead2_start, end_pos, 2)
         
+        bands = tuple(component.get_color_bands(component.resistance))
+        rotated_surf = self.sprites.get(("Resistor", bands, correct_angle), lambda: self.render_resistor(bands, correct_angle))
+        rect = rotated_surf.get_rect(center=(mid_x, mid_y))
+        self.screen.blit(rotated_surf, rect)
+
+    def render_resistor(self, bands, correct_angle):
+        body_length = 40
+        height = 15
         surf = pygame.Surface((body_length, height), pygame.SRCALPHA)
          
         body_color = (222, 184, 135)
@@ -903,7 +1114,6 @@ class BreadboardSimulator:
         center_rect = pygame.Rect(end_w, height*0.1, center_w, height*0.8)
         pygame.draw.rect(surf, body_color, center_rect)
         
-        bands = component.get_color_bands(component.resistance)
         band_w = width * 0.08
         
         positions = [0.2, 0.35, 0.5, 0.8]
@@ -914,14 +1124,20 @@ class BreadboardSimulator:
             rect = pygame.Rect(bx, 0, band_w, height)
             pygame.draw.rect(surf, color, rect)
 
-        rotated_surf = pygame.transform.rotate(surf, correct_angle)
-        rect = rotated_surf.get_rect(center=(mid_x, mid_y))
-        self.screen.blit(rotated_surf, rect)
+        return pygame.transform.rotate(surf, correct_angle)
 
     def draw_custom_capacitor(self, component, start_pos, end_pos, mid_x, mid_y, angle, length):
         pygame.draw.line(self.screen, (150, 150, 150), start_pos, (mid_x, mid_y), 2)
         pygame.draw.line(self.screen, (150, 150, 150), end_pos, (mid_x, mid_y), 2)
         
+        # Always drawn upright, so one sprite serves every capacitor
+        surf = self.sprites.get(("Capacitor",), self.render_capacitor)
+        ellipse_h = 8
+        target_rect = surf.get_rect(midbottom=(mid_x, mid_y + ellipse_h // 2 - 2))
+        
+        self.screen.blit(surf, target_rect.topleft)
+
+    def render_capacitor(self):
         cyl_w = 18
         cyl_h = 20
         ellipse_h = 8
@@ -955,9 +1171,7 @@ class BreadboardSimulator:
             
         pygame.draw.line(surf, (70, 70, 80), (3, ellipse_h // 2), (3, cyl_h + ellipse_h // 2 - 2), 2)
         
-        target_rect = surf.get_rect(midbottom=(mid_x, mid_y + ellipse_h // 2 - 2))
-        
-        self.screen.blit(surf, target_rect.topleft)
+        return surf
 
     def draw_custom_inductor(self, component, start_pos, end_pos, mid_x, mid_y, angle, length):
         dx = end_pos[0] - start_pos[0]
@@ -973,6 +1187,12 @@ class BreadboardSimulator:
             pygame.draw.line(self.screen, (150, 150, 150), start_pos, lead1_end, 2)
             pygame.draw.line(self.screen, (150, 150, 150), lead2_start, end_pos, 2)
             
+        rotated_surf = self.sprites.get(("Inductor", correct_angle), lambda: self.render_inductor(correct_angle))
+        rect = rotated_surf.get_rect(center=(mid_x, mid_y))
+        self.screen.blit(rotated_surf, rect)
+
+    def render_inductor(self, correct_angle):
+        diam = 30
         surf = pygame.Surface((diam, diam), pygame.SRCALPHA)
         cx, cy = diam // 2, diam // 2
         
@@ -1012,9 +1232,7 @@ class BreadboardSimulator:
             # Bright highlight in the center of the wire wrap
             pygame.draw.circle(surf, wire_hl, (int(x2), int(y2)), 1)
             
-        rotated_surf = pygame.transform.rotate(surf, correct_angle)
-        rect = rotated_surf.get_rect(center=(mid_x, mid_y))
-        self.screen.blit(rotated_surf, rect)
+        return pygame.transform.rotate(surf, correct_angle)
 
     def draw_custom_led(self, component, start_pos, end_pos, mid_x, mid_y, angle, length):
         pygame.draw.line(self.screen, (150, 150, 150), start_pos, (mid_x, mid_y), 2)
@@ -1030,7 +1248,15 @@ class BreadboardSimulator:
         else:
             actual_b = 0
             b = 0
+        # Brightness in LED_BRIGHTNESS_STEP buckets, so a glowing LED reuses a handful of sprites
+        b = round(b / LED_BRIGHTNESS_STEP) * LED_BRIGHTNESS_STEP
+        burnt = actual_b > 100.1
             
+        surf = self.sprites.get(("LED", led_c, b, burnt), lambda: self.render_led(led_c, b, burnt))
+        target_rect = surf.get_rect(midbottom=(int(mid_x), int(mid_y + 20)))
+        self.screen.blit(surf, target_rect.topleft)
+
+    def render_led(self, led_c, b, burnt):
         body_w = 14
         body_h = 16
         
@@ -1047,7 +1273,7 @@ class BreadboardSimulator:
         body_rect = pygame.Rect(cx - body_w//2, cy - body_h, body_w, body_h)
         base_c = (max(40, int(led_c[0]*0.2)), max(40, int(led_c[1]*0.2)), max(40, int(led_c[2]*0.2)))
         
-        if actual_b <= 100.1:
+        if not burnt:
             if b > 0:
                 bright_c = (
                     min(255, int(base_c[0] + (led_c[0] * 1.5 - base_c[0]) * (b / 100.0))),
@@ -1098,41 +1324,62 @@ class BreadboardSimulator:
             pygame.draw.line(surf, (0, 0, 0), (cx - body_w//2, cy - body_h), (cx + body_w//4, cy - body_h//3), 2)
             pygame.draw.line(surf, (0, 0, 0), (cx + body_w//4, cy - body_h//3), (cx - body_w//4, cy - body_h//4), 1)
 
-        target_rect = surf.get_rect(midbottom=(int(mid_x), int(mid_y + 20)))
-        self.screen.blit(surf, target_rect.topleft)
+
+        return surf
 
     def draw_fallback_component(self, component, x, y, angle, length):
+        label = ""
+        led_c = None
+        if component.name == "Battery":
+            label = f"{component.voltage}V"
+        elif component.name == "Resistor":
+            label = f"{component.resistance}"
+        elif component.name == "Capacitor":
+            label = f"{format_si(component.capacitance, 'F')}"
+        elif component.name == "Inductor":
+            label = f"{format_si(component.inductance, 'H')}"
+        elif component.name == "LED":
+            c_map = {"red": (255, 0, 0), "green": (0, 255, 0), "blue": (0, 0, 255), 
+                     "orange": (255, 165, 0)}
+            led_c = c_map.get(getattr(component, 'color', 'red'), (255, 0, 0))
+
+        # Rotate and blit
+        rotated_surf = self.sprites.get(("Fallback", component.name, led_c, length, angle), lambda: self.render_fallback(component.name, led_c, length, angle))
+        rect = rotated_surf.get_rect(center=(x, y))
+        self.screen.blit(rotated_surf, rect)
+        
+        # Draw label near component
+        if label:
+            text = self.sprites.get(("Label", str(label)), lambda: self.small_font.render(str(label), True, (0, 0, 0)))
+            self.screen.blit(text, (x - 10, y - 25))
+
+    def render_fallback(self, name, led_c, length, angle):
         surf = pygame.Surface((length, 20), pygame.SRCALPHA)
         
         color = (200, 200, 200)
-        label = ""
         
-        if component.name == "Battery":
+        if name == "Battery":
             color = (50, 50, 50)
-            label = f"{component.voltage}V"
             pygame.draw.rect(surf, color, (0, 0, length, 20), border_radius=4)
             pygame.draw.rect(surf, (200, 200, 200), (4, 4, length-8, 12)) 
             pygame.draw.line(surf, (0,0,0), (length//2 - 5, 10), (length//2 + 5, 10), 2)
             pygame.draw.line(surf, (0,0,0), (length//2, 5), (length//2, 15), 2)
 
-        elif component.name == "Resistor":
+        elif name == "Resistor":
             color = (210, 180, 140)
-            label = f"{component.resistance}"
             pygame.draw.rect(surf, color, (0, 0, length, 20), border_radius=5)
             pygame.draw.rect(surf, (255, 0, 0), (10, 0, 5, 20))
             pygame.draw.rect(surf, (0, 255, 0), (20, 0, 5, 20))
 
-        elif component.name == "Capacitor":
+        elif name == "Capacitor":
             color = (200, 200, 200)
-            label = f"{format_si(component.capacitance, 'F')}"
             pygame.draw.line(surf, (150, 150, 150), (0, 10), (length//2 - 5, 10), 2)
             pygame.draw.line(surf, (150, 150, 150), (length//2 + 5, 10), (length, 10), 2)
             pygame.draw.line(surf, (0, 0, 0), (length//2 - 5, 2), (length//2 - 5, 18), 3)
             pygame.draw.line(surf, (0, 0, 0), (length//2 + 5, 2), (length//2 + 5, 18), 3)
 
-        elif component.name == "Inductor":
+        elif name == "Inductor":
             color = (200, 140, 50)
-            label = f"{format_si(component.inductance, 'H')}"
             # Draw coil bumps
             num_bumps = 4
             bump_w = (length - 20) // num_bumps
@@ -1140,22 +1387,11 @@ class BreadboardSimulator:
                 bx = 10 + i * bump_w
                 pygame.draw.arc(surf, color, (bx, 2, bump_w, 16), 0, 3.14, 3)
 
-        elif component.name == "LED":
-            c_map = {"red": (255, 0, 0), "green": (0, 255, 0), "blue": (0, 0, 255), 
-                     "orange": (255, 165, 0)}
-            led_c = c_map.get(getattr(component, 'color', 'red'), (255, 0, 0))
-            label = ""
+        elif name == "LED":
             pygame.draw.ellipse(surf, led_c, (5, 0, length-10, 20))
 
-        # Rotate and blit
-        rotated_surf = pygame.transform.rotate(surf, angle)
-        rect = rotated_surf.get_rect(center=(x, y))
-        self.screen.blit(rotated_surf, rect)
-        
-        # Draw label near component
-        if label:
-            text = self.small_font.render(str(label), True, (0, 0, 0))
-            self.screen.blit(text, (x - 10, y - 25))
+        return pygame.transform.rotate(surf, angle)
+
     def create_buttons(self):
         # Component buttons
         self.buttons = []
@@ -1274,88 +1510,57 @@ class BreadboardSimulator:
                 y = self.board_y + 380 + row * HOLE_SPACING
                 actual_row = 13 + row
                 self.holes.append(Hole(x, y, actual_row, col, is_rail=True))
+
+        # Lookup by (row, col), and the sorted pixel lines of the rows and columns for hit testing
+        self.hole_grid = {(hole.row, hole.col): hole for hole in self.holes}
+        rows = sorted({(hole.y, hole.row) for hole in self.holes})
+        cols = sorted({(hole.x, hole.col) for hole in self.holes})
+        self.row_ys = [y for y, _ in rows]
+        self.row_ids = [row for _, row in rows]
+        self.col_xs = [x for x, _ in cols]
+        self.col_ids = [col for _, col in cols]
         
         self.init_node_system()
     def init_node_system(self):
-        self.uf = UnionFind(self.holes)
-        
-        for row in [0, 1]:
-            holes = [h for h in self.holes if h.row == row]
-            for i in range(len(holes) - 1):
-                self.uf.union(holes[i], holes[i+1])
-                
-        for row in [13, 14]:
-            holes = [h for h in self.holes if h.row == row]
-            for i in range(len(holes) - 1):
-                self.uf.union(holes[i], holes[i+1])
-        
-        for col in range(40):
-            # Top section
-            top_col_holes = [h for h in self.holes if 2 <= h.row <= 6 and h.col == col]
-            for i in range(len(top_col_holes) - 1):
-                self.uf.union(top_col_holes[i], top_col_holes[i+1])
-                
-            # Bottom section
-            bot_col_holes = [h for h in self.holes if 8 <= h.row <= 12 and h.col == col]
-            for i in range(len(bot_col_holes) - 1):
-                self.uf.union(bot_col_holes[i], bot_col_holes[i+1])
-        
-        # Helper to find a hole at coords
-        def get_h(r, c):
-            return next((h for h in self.holes if h.row == r and h.col == c), None)
-
-        # Row 0 -> ID 0
-        h = get_h(0, 0)
-        if h: self.uf.set_id(h, 0)
-        
-        # Row 1 -> ID 1
-        h = get_h(1, 0)
-        if h: self.uf.set_id(h, 1)
-
-        # Top Columns -> 2..41
-        for col in range(40):
-            h = get_h(2, col)
-            if h: self.uf.set_id(h, 2 + col)
-            
-        # Bottom Columns -> 42..81
-        for col in range(40):
-            h = get_h(8, col)
-            if h: self.uf.set_id(h, 42 + col)
-            
-        # Row 13 -> ID 82
-        h = get_h(13, 0)
-        if h: self.uf.set_id(h, 82)
-        
-        # Row 14 -> ID 83
-        h = get_h(14, 0)
-        if h: self.uf.set_id(h, 83)
-
-        self.sync_node_ids()
-    def sync_node_ids(self):
-        # Update every hole's local node_id property from the UF system
+        # Holes grouped by strip; every strip starts as its own node
+        self.connectivity = BoardConnectivity()
+        self.strip_holes = [[] for _ in range(NUM_STRIPS)]
         for hole in self.holes:
-            hole.node_id = self.uf.get_id(hole)    
-    def draw_breadboard(self):
+            self.strip_holes[strip_of(hole.row, hole.col)].append(hole)
+        self.sync_node_ids()
+    def sync_node_ids(self, strips=None):
+        # Update the node_id of every hole on these strips (all when None) from the connectivity
+        for strip in range(NUM_STRIPS) if strips is None else strips:
+            node_id = self.connectivity.node_id(strip)
+            for hole in self.strip_holes[strip]:
+                hole.node_id = node_id
+    def render_board_layer(self):
+        # Background, board and every hole in its plain color; none of it changes while running
+        layer = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
+        layer.fill(BG_COLOR)
         # Drop shadow
-        pygame.draw.rect(self.screen, (215, 220, 225),
+        pygame.draw.rect(layer, (215, 220, 225),
                         (self.board_x + 6, self.board_y + 6, self.board_width, self.board_height),
                         border_radius=10)
         # Main board
-        pygame.draw.rect(self.screen, BREADBOARD_COLOR,
+        pygame.draw.rect(layer, BREADBOARD_COLOR,
                         (self.board_x, self.board_y, self.board_width, self.board_height),
                         border_radius=10)                       
         # border
-        pygame.draw.rect(self.screen, (210, 215, 220),
+        pygame.draw.rect(layer, (210, 215, 220),
                         (self.board_x, self.board_y, self.board_width, self.board_height),
                         width=2, border_radius=10)
-        # Draw holes
         for hole in self.holes:
-            color = HOLE_COLOR
-            if hole == self.hovered_hole:
-                color = HOLE_HOVER_COLOR
-            elif hole == self.first_hole:
-                color = HOLE_SELECTED_COLOR
-            hole.draw(self.screen, color)
+            hole.draw(layer)
+        return layer
+
+    def draw_breadboard(self):
+        # The board and plain holes come from board_layer, only highlighted holes are drawn over it
+        self.screen.blit(self.board_layer, (0, 0))
+        if self.first_hole is not None:
+            self.first_hole.draw(self.screen, HOLE_SELECTED_COLOR)
+        if self.hovered_hole is not None:
+            self.hovered_hole.draw(self.screen, HOLE_HOVER_COLOR)
 
         # Draw components
         for component in self.components:
@@ -1491,20 +1696,9 @@ class BreadboardSimulator:
                 if self.sim_time_widget:
                     self.sim_time_widget.value = 0.0
                     self.sim_time_widget.text = "0.0"
-                for c in self.components:
-                    if isinstance(c, Capacitor):
-                        c.voltage_drop = 0.0
-                        c._prev_voltage_drop = 0.0
-                        c.current = 0.0
-                    elif isinstance(c, Inductor):
-                        c.voltage_drop = 0.0
-                        c.current = 0.0
-                        c._prev_current = 0.0
-                    elif isinstance(c, Resistor) or isinstance(c, LED):
-                        c.voltage_drop = 0.0
-                        c.current = 0.0
-                    elif isinstance(c, Battery):
-                        c.current = 0.0
+                reset_circuit_state(self.components)
+                self.stepper = None
+                self.record_checkpoints = True
                 print("Stopped simulation.")
                 return
             
@@ -1527,64 +1721,58 @@ class BreadboardSimulator:
                 return
         
         # Check holes for placement
-        for hole in self.holes:
-            if hole.contains(pos):
-                # Cannot use occupied holes
-                if hole.occupied:
-                    return
+        hole = self.hole_at(pos)
+        if hole is not None:
+            # Cannot use occupied holes
+            if hole.occupied:
+                return
 
-                if self.first_hole is None:
-                    self.first_hole = hole
-                    self.active_component.node_id_1 = hole.node_id
-                    print(f"Start: row={hole.row}, col={hole.col}, rail={hole.is_rail} [Node {hole.node_id}]")
-                else:
-                    if hole == self.first_hole:
-                        return
-                        
-                    self.save_state()
-                    
-                    self.active_component.node1 = (self.first_hole.row, self.first_hole.col)
-                    self.active_component.node2 = (hole.row, hole.col)
-                    self.active_component.node_id_2 = hole.node_id
-                    if isinstance(self.active_component, Wire):
-                        self.mergers.append(self.active_component)
-                        # Connect the nodes in UnionFind
-                        prev_id = max(self.first_hole.node_id, hole.node_id)
-                        target_id = min(self.first_hole.node_id, hole.node_id)
-                        self.uf.union(self.first_hole, hole)
-                        self.uf.set_id(self.first_hole, target_id)
-                        self.sync_node_ids()
-                        for component in self.components:
-                            if component.node_id_1 == prev_id:
-                                component.node_id_1 = target_id
-                            if component.node_id_2 == prev_id:
-                                component.node_id_2 = target_id
-                    else:
-                        self.components.append(self.active_component)
-                    print(f"End: row={hole.row}, col={hole.col}, rail={hole.is_rail} [Node {hole.node_id}]")
-                    print(f"Placing {self.active_component.name}")
-                    print("Current components: " + ", ".join(c.name for c in self.components))
+            if self.first_hole is None:
+                self.first_hole = hole
+                self.active_component.node_id_1 = hole.node_id
+                print(f"Start: row={hole.row}, col={hole.col}, rail={hole.is_rail} [Node {hole.node_id}]")
+            else:
+                if hole == self.first_hole:
+                    return
                     
-                    # Refresh active component so we don't reuse the same object
-                    if isinstance(self.active_component, Wire):
-                        self.active_component = Wire(0, 0)
-                    elif isinstance(self.active_component, Battery):
-                        self.active_component = Battery(0, 0, None, None, self.active_component.voltage)
-                    elif isinstance(self.active_component, Resistor):
-                        self.active_component = Resistor(0, 0, None, None, self.active_component.resistance, 0.0)
-                    elif isinstance(self.active_component, Capacitor):
-                        self.active_component = Capacitor(0, 0, None, None, self.active_component.capacitance, 0.0)
-                    elif isinstance(self.active_component, Inductor):
-                        self.active_component = Inductor(0, 0, None, None, self.active_component.inductance, 0.0)
-                    elif isinstance(self.active_component, LED):
-                        self.active_component = LED(0, 0, None, None, 220, 0.0, self.active_component.color)
-                        
-                    # Mark holes as occupied
-                    self.first_hole.occupied = True
-                    hole.occupied = True
+                self.save_state()
+                
+                self.active_component.node1 = (self.first_hole.row, self.first_hole.col)
+                self.active_component.node2 = (hole.row, hole.col)
+                self.active_component.node_id_2 = hole.node_id
+                if isinstance(self.active_component, Wire):
+                    self.mergers.append(self.active_component)
+                    # Merge the two nodes
+                    changed = self.connectivity.add_wire(strip_of(self.first_hole.row, self.first_hole.col), strip_of(hole.row, hole.col))
+                    self.apply_connectivity_change(changed)
+                else:
+                    self.components.append(self.active_component)
+                self.segment_index.add(self.active_component, (self.first_hole.x, self.first_hole.y), (hole.x, hole.y))
+                self.invalidate_circuit()
+                print(f"End: row={hole.row}, col={hole.col}, rail={hole.is_rail} [Node {hole.node_id}]")
+                print(f"Placing {self.active_component.name}")
+                print("Current components: " + ", ".join(c.name for c in self.components))
+                
+                # Refresh active component so we don't reuse the same object
+                if isinstance(self.active_component, Wire):
+                    self.active_component = Wire(0, 0)
+                elif isinstance(self.active_component, Battery):
+                    self.active_component = Battery(0, 0, None, None, self.active_component.voltage)
+                elif isinstance(self.active_component, Resistor):
+                    self.active_component = Resistor(0, 0, None, None, self.active_component.resistance, 0.0)
+                elif isinstance(self.active_component, Capacitor):
+                    self.active_component = Capacitor(0, 0, None, None, self.active_component.capacitance, 0.0)
+                elif isinstance(self.active_component, Inductor):
+                    self.active_component = Inductor(0, 0, None, None, self.active_component.inductance, 0.0)
+                elif isinstance(self.active_component, LED):
+                    self.active_component = LED(0, 0, None, None, 220, 0.0, self.active_component.color)
                     
-                    self.first_hole = None
-                return 
+                # Mark holes as occupied
+                self.first_hole.occupied = True
+                hole.occupied = True
+                
+                self.first_hole = None
+            return 
 
     def update_active_component_param(self, value):
         multiplier = 1.0
@@ -1597,6 +1785,7 @@ class BreadboardSimulator:
              elif u in ["µF", "µH"]: multiplier = 1e-6
              elif u in ["nF", "nH"]: multiplier = 1e-9
              elif u in ["pF"]: multiplier = 1e-12
+        self.invalidate_circuit()
         if self.active_component_txt == "LED":
             actual_val = value # For LEDs, value is the color string
         else:
@@ -1618,6 +1807,30 @@ class BreadboardSimulator:
              self.active_component = LED(0, 0, None, None, 220, 0.0, value)
              self.component_defaults["LED"] = value
 
+    def advance_simulation(self):
+        # One current_dt slice of the running simulation; the scheduler decides how many run per frame
+        compiled = self.compile_circuit()
+        dt_base = self.current_dt
+        
+        substeps = 10
+        dt_sim = dt_base / substeps
+        if self.adaptive_stepping:
+            if self.stepper is None:
+                self.stepper = AdaptiveStepper(compiled, dt_sim)
+            self.stepper.advance(dt_base)
+        else:
+            for _ in range(substeps):
+                compiled.step(dt_sim)
+            
+        self.sim_time += dt_base
+        if self.record_checkpoints and self.checkpoints.due(self.sim_time):
+            self.checkpoints.save(self.sim_time, compiled.save_state())
+
+    def change_sim_speed(self, factor):
+        speed = min(MAX_SIM_SPEED, max(MIN_SIM_SPEED, self.scheduler.speed * factor))
+        self.scheduler.speed = speed
+        print(f"Simulation speed: {speed:g}x")
+
     def jump_to_time(self, target_time):
         self.sim_paused = True
         self.sim_time = target_time
@@ -1625,60 +1838,126 @@ class BreadboardSimulator:
             self.sim_time_widget.value = target_time
         
         # Reset back to 0
-        for c in self.components:
-            if isinstance(c, Capacitor):
-                c.voltage_drop = 0.0
-                c._prev_voltage_drop = 0.0
-                c.current = 0.0
-            elif isinstance(c, Inductor):
-                c.voltage_drop = 0.0
-                c.current = 0.0
-                c._prev_current = 0.0
-            elif isinstance(c, Resistor) or isinstance(c, LED):
-                c.voltage_drop = 0.0
-                c.current = 0.0
-            elif isinstance(c, Battery):
-                c.current = 0.0
+        reset_circuit_state(self.components)
+        self.stepper = None
                 
         if len(self.components) == 0:
             return
             
-        active_nodes = list(set([c.node_id_1 for c in self.components] + [c.node_id_2 for c in self.components]))
-        tau = calculate_time_constant(self.components)
-        if tau is None or tau < 1e-6:
-            total_R = sum(c.resistance for c in self.components if isinstance(c, Resistor))
-            total_C = sum(c.capacitance for c in self.components if isinstance(c, Capacitor))
-            total_L = sum(c.inductance for c in self.components if isinstance(c, Inductor))
-            if total_R > 0 and total_C > 0:
-                tau = total_R * total_C
-            elif total_R > 0 and total_L > 0:
-                tau = total_L / total_R
-            elif total_L > 0 and total_C > 0:
-                import math
-                tau = 2 * math.pi * math.sqrt(total_L * total_C)
-        self.current_tau = tau
-        dt_base = tau / 60.0 if tau else 1/60.0
-        self.current_dt = dt_base
+        compiled = self.compile_circuit()
+        dt_base = self.current_dt
+        self.record_checkpoints = True
+
+        # Resume from the nearest earlier checkpoint instead of replaying from 0
+        start_time, state = self.checkpoints.latest_before(target_time)
+        if state is not None:
+            compiled.restore_state(state)
+        span = target_time - start_time
         
         dt_sim = dt_base / 100.0 if dt_base > 0 else 1/6000.0
-        steps = int(target_time / dt_sim) if dt_sim > 0 else 0
-        
+        steps = int(span / dt_sim) if dt_sim > 0 else 0
+        
+        if self.fast_jump and compiled.is_linear and steps > 0:
+            # Every step is the same affine map of the state, so apply all but the last in closed form
+            remainder = span - (steps * dt_sim)
+            propagator = compiled.propagator(dt_sim)
+            compiled.restore_state(propagator.advance(compiled.save_state(), steps - 1))
+            compiled.step(dt_sim)
+            reached = start_time + steps * dt_sim
+            if remainder > 1e-6:
+                compiled.step(remainder)
+                reached = target_time
+            self.checkpoints.save(reached, compiled.save_state())
+            return
+
         MAX_STEPS = 10000
+        if self.adaptive_stepping:
+            # dt may grow where the response is smooth, but never shrinks below the MAX_STEPS budget
+            # Its floor only suits this jump, so live running afterwards starts a fresh stepper at current_dt/10
+            dt_min = span / MAX_STEPS
+            stepper = AdaptiveStepper(compiled, max(dt_sim, dt_min), dt_min=dt_min)
+            while stepper.t < span * (1 - 1e-12):
+                stepper.advance(min(self.checkpoints.interval, span - stepper.t))
+                self.checkpoints.save(start_time + stepper.t, compiled.save_state())
+            return
+
         if steps > MAX_STEPS:
-            dt_sim = target_time / MAX_STEPS
+            dt_sim = span / MAX_STEPS
             steps = MAX_STEPS
             
-        remainder = target_time - (steps * dt_sim)
-        
-        matrix = generate_incidence_matrix(self.components, active_nodes)
+        remainder = span - (steps * dt_sim)
+        checkpoint_steps = max(1, int(self.checkpoints.interval / dt_sim))
         
         # Simulate forward
-        for _ in range(steps):
-             ModifiedNodalAnalysis(matrix, self.components, active_nodes, dt=dt_sim)
+        for k in range(1, steps + 1):
+             compiled.step(dt_sim)
+             if k % checkpoint_steps == 0:
+                 self.checkpoints.save(start_time + k * dt_sim, compiled.save_state())
              
-        # Simulate exact remainder
-        if remainder > 1e-6:
-             ModifiedNodalAnalysis(matrix, self.components, active_nodes, dt=remainder)
+        # Simulate exact remainder (a span shorter than one step is all remainder; a zero span needs no step)
+        if remainder > 1e-6 or (steps == 0 and remainder > 0):
+             compiled.step(remainder)
+
+    def changed_tiles(self):
+        # DIRTY_TILE squares of the screen that differ from the last presented frame (all of them
+        # when there is no previous frame to compare against)
+        # Compared as rows of pixels, the screen's memory order, against a contiguous copy of the last frame
+        pixels = pygame.surfarray.pixels2d(self.screen).T
+        h, w = pixels.shape
+        if self.last_frame is None:
+            self.last_frame = pixels.copy()
+            changed = numpy.ones((h // DIRTY_TILE, w // DIRTY_TILE), dtype=bool)
+        else:
+            changed = (pixels != self.last_frame).reshape(h, w // DIRTY_TILE, DIRTY_TILE).any(axis=2)
+            changed = changed.reshape(h // DIRTY_TILE, DIRTY_TILE, w // DIRTY_TILE).any(axis=1)
+            numpy.copyto(self.last_frame, pixels)
+        del pixels  # unlocks the screen
+        return [pygame.Rect(tx * DIRTY_TILE, ty * DIRTY_TILE, DIRTY_TILE, DIRTY_TILE) for ty, tx in zip(*numpy.nonzero(changed))]
+
+    def present(self):
+        # Scale the internal screen into the window with aspect ratio preserved, letterboxing if needed.
+        # Tiles are always scaled one by one with the same edge rounding, so a tile redrawn later
+        # lines up exactly with its neighbors, and only the tiles that changed are scaled and updated
+        win_w, win_h = self.window.get_size()
+        scale = min(win_w / WINDOW_WIDTH, win_h / WINDOW_HEIGHT)
+        scaled_w = int(WINDOW_WIDTH * scale)
+        scaled_h = int(WINDOW_HEIGHT * scale)
+        offset_x = (win_w - scaled_w) // 2
+        offset_y = (win_h - scaled_h) // 2
+        # Copyright notice — drawn on window so it anchors to the real corner
+        copyright_surf = self.copyright_font.render("\u00a9 2026 Anay Gokhale | Licensed under Apache 2.0", True, (160, 170, 180))
+        copyright_rect = copyright_surf.get_rect(bottomleft=(5, win_h - 5))
+
+        full = self.presented_size != (win_w, win_h)
+        if full:
+            # New window size: every tile is redrawn
+            self.presented_size = (win_w, win_h)
+            self.last_frame = None
+            self.window.fill(BG_COLOR)
+
+        updated = []
+        for tile in self.changed_tiles():
+            left = offset_x + round(tile.left * scale)
+            top = offset_y + round(tile.top * scale)
+            target = pygame.Rect(left, top, offset_x + round(tile.right * scale) - left, offset_y + round(tile.bottom * scale) - top)
+            if target.width <= 0 or target.height <= 0:
+                continue
+            piece = self.screen.subsurface(tile)
+            if target.size != tile.size:
+                piece = pygame.transform.smoothscale(piece, target.size)
+            self.window.blit(piece, target)
+            if not full and target.colliderect(copyright_rect):
+                # Put the notice back over this tile only, the rest of it is still on screen
+                self.window.set_clip(target)
+                self.window.blit(copyright_surf, copyright_rect)
+                self.window.set_clip(None)
+            updated.append(target)
+
+        if full:
+            self.window.blit(copyright_surf, copyright_rect)
+            pygame.display.flip()
+        elif updated:
+            pygame.display.update(updated)
 
     def get_internal_pos(self, pos):
         win_w, win_h = self.window.get_size()
@@ -1749,46 +2028,23 @@ class BreadboardSimulator:
                             
                     if not widget_handled_key and (event.key == pygame.K_DELETE or event.key == pygame.K_BACKSPACE):
                         self.delete_selected_component()
+                    elif not widget_handled_key and event.key in (pygame.K_LEFTBRACKET, pygame.K_RIGHTBRACKET):
+                        self.change_sim_speed(2.0 if event.key == pygame.K_RIGHTBRACKET else 0.5)
                 elif event.type == pygame.MOUSEMOTION:
-                    self.hovered_hole = None
-                    for hole in self.holes:
-                        if hole.contains(event.pos):
-                            self.hovered_hole = hole
-                            break
+                    self.hovered_hole = self.hole_at(event.pos)
                     
-            if self.is_simulating:
-                if self.sim_time_widget:
-                    self.sim_time_widget.value = self.sim_time
-                if not self.sim_paused and len(self.components) > 0:
-                    active_nodes = list(set([c.node_id_1 for c in self.components] + [c.node_id_2 for c in self.components]))
-                    try:
-                        matrix = generate_incidence_matrix(self.components, active_nodes)
-                        tau = calculate_time_constant(self.components)
-                        if tau is None or tau < 1e-6:
-                            total_R = sum(c.resistance for c in self.components if isinstance(c, Resistor))
-                            total_C = sum(c.capacitance for c in self.components if isinstance(c, Capacitor))
-                            total_L = sum(c.inductance for c in self.components if isinstance(c, Inductor))
-                            if total_R > 0 and total_C > 0:
-                                tau = total_R * total_C
-                            elif total_R > 0 and total_L > 0:
-                                tau = total_L / total_R
-                            elif total_L > 0 and total_C > 0:
-                                import math
-                                tau = 2 * math.pi * math.sqrt(total_L * total_C)
-                        self.current_tau = tau
-                        dt_base = tau / 60.0 if tau else 1/60.0
-                        self.current_dt = dt_base
-                        
-                        substeps = 10
-                        dt_sim = dt_base / substeps
-                        for _ in range(substeps):
-                            ModifiedNodalAnalysis(matrix, self.components, active_nodes, dt=dt_sim)
-                            
-                        self.sim_time += dt_base
-                    except Exception as e:
-                        print(f"Simulation warning: {e}")
-            
-            self.screen.fill(BG_COLOR)
+            # Stepping runs on its own wall-clock budget; drawing below reads whatever state the last
+            # completed slice left behind
+            if self.is_simulating and not self.sim_paused and len(self.components) > 0:
+                try:
+                    self.scheduler.advance()
+                except Exception as e:
+                    self.scheduler.reset()
+                    print(f"Simulation warning: {e}")
+            else:
+                self.scheduler.reset()
+            if self.is_simulating and self.sim_time_widget:
+                self.sim_time_widget.value = self.sim_time
             
             # Draw UI            
             self.draw_breadboard()
@@ -1798,22 +2054,7 @@ class BreadboardSimulator:
             if self.param_unit_widget:
                 self.param_unit_widget.draw(self.screen, self.font, m_pos)
 
-            # Scale and blit to window
-                        # Scale with aspect ratio preserved, letterboxing if needed
-            win_w, win_h = self.window.get_size()
-            scale = min(win_w / WINDOW_WIDTH, win_h / WINDOW_HEIGHT)
-            scaled_w = int(WINDOW_WIDTH * scale)
-            scaled_h = int(WINDOW_HEIGHT * scale)
-            offset_x = (win_w - scaled_w) // 2
-            offset_y = (win_h - scaled_h) // 2
-            scaled = pygame.transform.smoothscale(self.screen, (scaled_w, scaled_h))
-            self.window.fill(BG_COLOR)
-            self.window.blit(scaled, (offset_x, offset_y))
-
-            # Copyright notice — drawn on window so it anchors to the real corner
-            copyright_surf = self.copyright_font.render("\u00a9 2026 Anay Gokhale | Licensed under Apache 2.0", True, (160, 170, 180))
-            self.window.blit(copyright_surf, (5, win_h - copyright_surf.get_height() - 5))
-            pygame.display.flip()
+            self.present()
             self.clock.tick(60)
             await asyncio.sleep(0)
         
@@ -1,12 +1,16 @@
 import sys
 import os
 import math
+import random
 import numpy as np
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from Components import Wire, Battery, Resistor, Capacitor, Inductor, LED
 from Physics import ModifiedNodalAnalysis, generate_incidence_matrix, calculate_time_constant
+from Physics import CompiledCircuit, AdaptiveStepper, StepPropagator, led_parameters
+from Simulation import sweep, ac_sweep
+from Board import BoardConnectivity, NUM_STRIPS
 
 def create_component(c_type, node1, node2, **kwargs):
     if c_type == "Battery":
@@ -17,6 +21,8 @@ def create_component(c_type, node1, node2, **kwargs):
         return Capacitor((0,0), (0,0), node1, node2, kwargs['C'], 0)
     elif c_type == "Inductor":
         return Inductor((0,0), (0,0), node1, node2, kwargs['L'], 0)
+    elif c_type == "LED":
+        return LED((0,0), (0,0), node1, node2, kwargs['R'], 0, kwargs['color'])
     return None
 
 def run_simulation(name, components, active_nodes, is_lc=False, T=None):
@@ -100,6 +106,160 @@ def run_simulation(name, components, active_nodes, is_lc=False, T=None):
     output.append("\n" + "="*40 + "\n")
     return "\n".join(output)
 
+def report_check(name, error, tolerance, notes=()):
+    output = [f"=== Check: {name} ==="]
+    output.extend(notes)
+    output.append(f"Error: {error:.3e} (tolerance {tolerance:.0e})")
+    output.append("PASS" if error <= tolerance else "FAIL")
+    output.append("\n" + "="*40 + "\n")
+    return "\n".join(output)
+
+def check_adaptive_rc(R, C, dt, t_stop):
+    # Adaptive steps against the analytic charging curve 1 - exp(-t/RC) of a 1 V source.
+    # Returns the largest error over all steps, the error at t_stop and the stepper
+    components = [
+        create_component("Battery", 0, 1, V=1),
+        create_component("Resistor", 1, 2, R=R),
+        create_component("Capacitor", 2, 0, C=C),
+    ]
+    compiled = CompiledCircuit(components)
+    stepper = AdaptiveStepper(compiled, dt)
+    max_error = 0.0
+    while stepper.t < t_stop * (1 - 1e-12):
+        stepper.step(t_stop)
+        error = abs(components[2].voltage_drop - (1 - math.exp(-stepper.t / (R * C))))
+        max_error = max(max_error, error)
+    return max_error, error, stepper
+
+def rlc_components():
+    # A fresh copy of circuit 6
+    return [
+        create_component("Battery", 0, 1, V=10),
+        create_component("Resistor", 1, 2, R=50),
+        create_component("Resistor", 2, 3, R=100),
+        create_component("Inductor", 2, 3, L=10e-3),
+        create_component("Capacitor", 2, 3, C=10e-6),
+        create_component("Resistor", 3, 0, R=200),
+        create_component("Inductor", 3, 0, L=20e-3),
+        create_component("Capacitor", 3, 0, C=20e-6),
+        create_component("Resistor", 2, 0, R=300),
+        create_component("Inductor", 2, 0, L=30e-3),
+        create_component("Capacitor", 2, 0, C=30e-6),
+    ]
+
+def check_propagator(steps, dt):
+    # State after `steps` closed-form steps against stepping one at a time, relative to the largest state value
+    compiled = CompiledCircuit(rlc_components())
+    propagated = StepPropagator(compiled, dt).advance(compiled.save_state(), steps)
+    for _ in range(steps):
+        compiled.step(dt)
+    stepped = compiled.save_state()
+    return np.max(np.abs(propagated - stepped)) / np.max(np.abs(stepped))
+
+def rl_loop_components():
+    # Two inductors in a loop with the source and load, so only their L ratio splits the current
+    return [
+        create_component("Battery", 0, 1, V=10),
+        create_component("Resistor", 1, 2, R=100),
+        create_component("Inductor", 2, 0, L=10e-3),
+        create_component("Inductor", 2, 0, L=30e-3),
+        create_component("Resistor", 2, 0, R=50),
+    ]
+
+def check_operating_point(make_components, t_stop, dt):
+    # DC operating point against a transient run long enough to settle, relative to the largest value
+    compiled = CompiledCircuit(make_components())
+    for _ in range(int(round(t_stop / dt))):
+        voltages, _ = compiled.step(dt)
+    settled = np.concatenate([voltages, compiled.branch_currents()])
+    op_voltages, op_currents = CompiledCircuit(make_components()).operating_point()
+    op = np.concatenate([op_voltages, op_currents])
+    return np.max(np.abs(op - settled)) / np.max(np.abs(settled))
+
+def check_ac(components, node, transfer):
+    # ac_sweep from 1 Hz to 1 MHz at one node against an analytic transfer function H(jω), relative to max |H|
+    frequencies, magnitude_db, phase_deg = ac_sweep(components, 1, 1e6, 20, nodes=[node])
+    response = 10 ** (magnitude_db[:, 0] / 20) * np.exp(1j * np.radians(phase_deg[:, 0]))
+    exact = transfer(2j * np.pi * frequencies)
+    return np.max(np.abs(response - exact)) / np.max(np.abs(exact))
+
+def led_current(V, R, color, R_led=5):
+    # Closed-form current of a battery, resistor and LED loop: V = I (R + R_led) + nVt ln(1 + I/Is), by bisection
+    saturation, nvt = (float(p[0]) for p in led_parameters([color]))
+    low, high = 0.0, V / (R + R_led)
+    for _ in range(200):
+        current = 0.5 * (low + high)
+        if current * (R + R_led) + nvt * math.log1p(current / saturation) > V:
+            high = current
+        else:
+            low = current
+    return current
+
+def check_led(V, R, color):
+    # Newton-solved LED current against led_current; the GMIN shunts leave about 1e-9 relative
+    components = [
+        create_component("Battery", 0, 1, V=V),
+        create_component("Resistor", 1, 2, R=R),
+        create_component("LED", 2, 0, R=5, color=color),
+    ]
+    current = led_current(V, R, color)
+    CompiledCircuit(components).step(1e-3)
+    return abs(components[2].current - current) / current, current
+
+def led_small_signal(V, R, color, R_led=5):
+    # Conductance of an LED biased by a battery and resistor: its junction's (I + Is)/nVt in series with R_led
+    saturation, nvt = (float(p[0]) for p in led_parameters([color]))
+    g_d = (led_current(V, R, color, R_led) + saturation) / nvt
+    return g_d / (1 + R_led * g_d)
+
+def check_sweep(values, t_stop, dt):
+    # sweep of R0 of circuit 6 against compiling and stepping each value directly, relative to the largest value
+    _, waveforms = sweep(rlc_components(), 1, values, t_stop, dt, processes=1)
+    error = 0.0
+    for value, waveform in zip(values, waveforms):
+        components = rlc_components()
+        components[1].resistance = value
+        compiled = CompiledCircuit(components)
+        rows = []
+        for k in range(1, int(round(t_stop / dt)) + 1):
+            voltages, _ = compiled.step(dt)
+            rows.append(np.concatenate([[k * dt], voltages, compiled.branch_currents()]))
+        error = max(error, np.max(np.abs(waveform - np.array(rows))) / np.max(np.abs(waveform)))
+    return error
+
+def check_sweep_batched(values, t_stop, dt):
+    # Serial per-variant sweep (deep-copied CompiledCircuit) against the batched one, relative to the largest value
+    _, serial = sweep(rlc_components(), 1, values, t_stop, dt, processes=1)
+    _, batched = sweep(rlc_components(), 1, values, t_stop, dt, batched=True)
+    return np.max(np.abs(serial - batched)) / np.max(np.abs(batched))
+
+def check_connectivity(sequences, length):
+    # Incremental BoardConnectivity against node ids rebuilt from scratch (each strip takes the
+    # smallest strip it is wired to) over random wire placements and removals; returns mismatches
+    rng = random.Random(0)
+    mismatches = 0
+    for _ in range(sequences):
+        board = BoardConnectivity()
+        wires = []
+        for _ in range(length):
+            if wires and rng.random() < 0.4:
+                board.remove_wire(*wires.pop(rng.randrange(len(wires))))
+            else:
+                wire = (rng.randrange(NUM_STRIPS), rng.randrange(NUM_STRIPS))
+                wires.append(wire)
+                board.add_wire(*wire)
+            rebuilt = list(range(NUM_STRIPS))
+            changed = True
+            while changed:
+                changed = False
+                for a, b in wires:
+                    low = min(rebuilt[a], rebuilt[b])
+                    if rebuilt[a] != low or rebuilt[b] != low:
+                        rebuilt[a] = rebuilt[b] = low
+                        changed = True
+            mismatches += sum(board.node_id(strip) != rebuilt[strip] for strip in range(NUM_STRIPS))
+    return mismatches
+
 results = []
 
 # 1. Series Resistor Circuit
@@ -173,6 +333,57 @@ c6 = [
 ]
 results.append(run_simulation("Circuit 6: RLC Series and Parallel Mixed", c6, [0, 1, 2, 3], is_lc=False))
 
+# Adaptive timestep: RC charging against its analytic curve
+max_error, _, stepper = check_adaptive_rc(1e3, 1e-6, 1e-5, 5e-3)
+results.append(report_check("Adaptive RC, dt = tau/100, max over all steps", max_error, 1e-3, [f"Steps: {stepper.steps}, rejected: {stepper.rejected}"]))
+# A first dt of 10 tau must be rejected, not accepted and doubled; the steps forced at the dt floor are reported
+_, final_error, stepper = check_adaptive_rc(10, 1e-6, 1e-4, 2e-4)
+results.append(report_check("Adaptive RC, dt = 10 tau, error at t = 20 tau", final_error, 1e-3,
+                            [f"Steps: {stepper.steps}, rejected: {stepper.rejected}, forced at dt floor: {stepper.forced}"]))
+
+# Closed-form jump: StepPropagator against the same number of fixed steps
+results.append(report_check("StepPropagator, 1000 steps of circuit 6", check_propagator(1000, 1e-5), 1e-9))
+
+# DC operating point: node voltages and branch currents against a 0.5 s transient
+results.append(report_check("Operating point, circuit 6 (RLC)", check_operating_point(rlc_components, 0.5, 1e-4), 1e-9))
+results.append(report_check("Operating point, inductor loop", check_operating_point(rl_loop_components, 0.5, 1e-4), 1e-9))
+
+# AC sweep: RC low-pass, series RLC (across C) and an LED-loaded RC against their transfer functions
+rc_lowpass = [
+    create_component("Battery", 0, 1, V=1),
+    create_component("Resistor", 1, 2, R=1e3),
+    create_component("Capacitor", 2, 0, C=1e-6),
+]
+results.append(report_check("AC response, RC low-pass", check_ac(rc_lowpass, 2, lambda s: 1 / (1 + s * 1e3 * 1e-6)), 1e-8))
+series_rlc = [
+    create_component("Battery", 0, 1, V=1),
+    create_component("Resistor", 1, 2, R=10),
+    create_component("Inductor", 2, 3, L=10e-3),
+    create_component("Capacitor", 3, 0, C=10e-6),
+]
+results.append(report_check("AC response, series RLC", check_ac(series_rlc, 3, lambda s: 1 / (1 + s * 10 * 10e-6 + s**2 * 10e-3 * 10e-6)), 1e-8))
+# The LED is linearized at its operating point (5 V through 1 kohm), not at the 0 V of a fresh circuit
+led_lowpass = [
+    create_component("Battery", 0, 1, V=5),
+    create_component("Resistor", 1, 2, R=1e3),
+    create_component("Capacitor", 2, 0, C=1e-6),
+    create_component("LED", 2, 0, R=5, color="red"),
+]
+g_led = led_small_signal(5, 1e3, "red")
+results.append(report_check("AC response, RC low-pass with LED", check_ac(led_lowpass, 2, lambda s: 1e-3 / (1e-3 + g_led + s * 1e-6)), 1e-8))
+
+# LEDs: Newton solve of the Shockley model against its I-V curve, from dim to above the rated current
+for V, R, color in [(3, 1e3, "red"), (5, 150, "green"), (9, 330, "blue")]:
+    error, current = check_led(V, R, color)
+    results.append(report_check(f"LED forward current, {V} V, {R:g} ohm, {color}", error, 1e-8, [f"Current: {current:.5e} A"]))
+
+# Parameter sweep: R0 of circuit 6 against direct runs, and stepped per variant against in lockstep
+results.append(report_check("Sweep of circuit 6 R0 vs direct runs", check_sweep([25, 50, 100], 5e-3, 1e-5), 1e-9))
+results.append(report_check("Sweep of circuit 6 R0, serial vs batched", check_sweep_batched([25, 50, 100], 5e-3, 1e-5), 1e-9))
+
+# Breadboard nodes: wire-by-wire connectivity against a full rebuild
+results.append(report_check("Board connectivity, 200 random wire sequences", check_connectivity(200, 60), 0))
+
 with open("circuit_test_results.txt", "w") as f:
     f.write("\n".join(results))
 